@@ -0,0 +1,159 @@
+"""
+    Memory held by decoded blocks and by a chain built from them, in bytes per transaction and per block,
+    for the current tree and for the baseline revision, the last one before __slots__ and compact fields.
+
+    Blocks are made of synthetic one input, two output transactions shaped like the ones sign_inputs produces.
+    They go through JSON first, as when received from another node, so no string is shared between transactions.
+    Both trees get the same blocks, each is measured in its own interpreter with the baseline taken from git.
+
+    Usage: python benchmarks/memory_footprint.py [--blocks 50] [--transactions 100] [--baseline REVISION]
+"""
+import argparse
+import gc
+import io
+import json
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+# Last revision before __slots__ and compact fields
+BASELINE_REVISION = "7d3690b"
+SEED = 16
+
+# Hex lengths of a signature, a PEM public key, a transaction hash and a public key hash
+SIGNATURE_HEX_LENGTH = 512
+PUBLIC_KEY_HEX_LENGTH = 900
+HASH_HEX_LENGTH = 64
+PUBLIC_KEY_HASH_HEX_LENGTH = 40
+
+
+def random_hex(rng: random.Random, length: int) -> str:
+    return rng.randbytes(length // 2).hex()
+
+
+def make_block_json(rng: random.Random, index: int, number_of_transactions: int, previous_hash: str) -> str:
+    transactions = []
+    for _ in range(number_of_transactions):
+        transactions.append({
+            "inputs": [{
+                "transaction_hash": random_hex(rng, HASH_HEX_LENGTH),
+                "output_index": 0,
+                "unlocking_script": f"{random_hex(rng, SIGNATURE_HEX_LENGTH)} {random_hex(rng, PUBLIC_KEY_HEX_LENGTH)}",
+            }],
+            "outputs": [{"amount": 1.5, "public_key_hash": random_hex(rng, PUBLIC_KEY_HASH_HEX_LENGTH)},
+                        {"amount": 3.25, "public_key_hash": random_hex(rng, PUBLIC_KEY_HASH_HEX_LENGTH)}],
+            "is_coin_base": False,
+        })
+    header = {"index": index, "previous_hash": previous_hash, "merkle_root": random_hex(rng, HASH_HEX_LENGTH),
+              "nonce": 12345, "timestamp": 1700000000.5 + index}
+    return json.dumps({"header": header, "transactions": transactions})
+
+
+def decode_blocks(block_class, blocks_json):
+    """
+        Decodes the blocks and computes what validation caches on them.
+    """
+    blocks = []
+    for block_json in blocks_json:
+        block = block_class.from_json(json.loads(block_json))
+        block.header.hash
+        for transaction in block.transactions:
+            transaction.hash
+            transaction.merkle_leaf_bytes
+        blocks.append(block)
+    return blocks
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    result = build()
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, end - start
+
+
+def measure_tree(number_of_blocks: int, transactions_per_block: int) -> dict:
+    """
+        Measures the tree found first on sys.path, returns the decoded and connected sizes in bytes.
+    """
+    from src.core.blockchain import Blockchain
+    from src.core.blocks.block import Block
+    from src.wallet.wallet import Wallet
+
+    blockchain = Blockchain(wallet=Wallet())
+    rng = random.Random(SEED)
+    previous_hash = blockchain.last_block.header.hash
+    blocks_json = []
+    for index in range(2, number_of_blocks + 2):
+        blocks_json.append(make_block_json(rng, index, transactions_per_block, previous_hash))
+        previous_hash = random_hex(rng, HASH_HEX_LENGTH)
+
+    blocks, decoded_size = measure(lambda: decode_blocks(Block, blocks_json))
+
+    def connect_blocks():
+        for block in blocks:
+            blockchain.connect_block(block)
+
+    _, connected_size = measure(connect_blocks)
+    return {"decoded": decoded_size, "connected": decoded_size + connected_size}
+
+
+def run_tree(tree: Path, args) -> dict:
+    result = subprocess.run([sys.executable, __file__, "--tree", str(tree), "--blocks", str(args.blocks),
+                             "--transactions", str(args.transactions)],
+                            capture_output=True, text=True, cwd=tree)
+    if result.returncode != 0:
+        sys.exit(f"Measuring {tree} failed:\n{result.stderr}")
+    # The tree may print while it builds the chain, the sizes are on the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def extract_revision(revision: str, directory: str) -> Path:
+    result = subprocess.run(["git", "-C", str(REPOSITORY_ROOT), "archive", revision], capture_output=True)
+    if result.returncode != 0:
+        sys.exit(f"Unable to read revision {revision} from git, pass another one with --baseline:\n"
+                 f"{result.stderr.decode(errors='replace')}")
+    with tarfile.open(fileobj=io.BytesIO(result.stdout)) as archive:
+        archive.extractall(directory)
+    return Path(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=100)
+    parser.add_argument("--baseline", default=BASELINE_REVISION, help="git revision to compare with")
+    parser.add_argument("--tree", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.tree:
+        # The legacy network module imports its siblings from src
+        sys.path[:0] = [str(args.tree), str(args.tree / "src")]
+        print(json.dumps(measure_tree(args.blocks, args.transactions)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = run_tree(extract_revision(args.baseline, directory), args)
+    current = run_tree(REPOSITORY_ROOT, args)
+    number_of_transactions = args.blocks * args.transactions
+
+    print(f"{args.blocks} blocks of {args.transactions} transactions, baseline {args.baseline}")
+    print(f"{'':32}{'baseline':>12}{'current':>12}")
+    for label, key in (("Decoded blocks", "decoded"), ("Connected chain", "connected")):
+        print(f"{label + ', per transaction':32}{baseline[key] / number_of_transactions:>10,.0f} B"
+              f"{current[key] / number_of_transactions:>10,.0f} B")
+        print(f"{label + ', per block':32}{baseline[key] / args.blocks:>10,.0f} B"
+              f"{current[key] / args.blocks:>10,.0f} B")
+    print("Connected chain counts the blocks, the UTXO set and the indexes")
+
+
+if __name__ == '__main__':
+    main()
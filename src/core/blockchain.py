@@ -1,12 +1,18 @@
-import copy
-import json
+import threading
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from src.core.blocks.block import Block, BlockHeader
+from src.core.blocks.mining import MiningEngine
+from src.core.mempool import Mempool, MempoolException, MempoolUTXOView
 from src.core.merkle_tree import MerkleTree
-from src.core.transactions.transaction import Transaction
-from src.utils.io_mem_pool import get_transactions_from_memory, reset_transaction_memory
+from src.core.orphan_pool import OrphanPool
+from src.core.transactions.signature_verification import SignatureVerifier
+from src.core.transactions.transaction import Transaction, TransactionOutput
+from src.core.utxo_set import BlockUndo, UTXOSet
+from src.core.validation_cache import ValidationCache
+from src.utils.consts import BLOCK_CACHE_SIZE, MAX_REORG_DEPTH
+from src.utils.io_block_store import BlockStore
 from src.wallet.wallet import Wallet
 
 
@@ -14,6 +20,26 @@ class BlockchainException(Exception):
     pass
 
 
+class OrphanBlockException(BlockchainException):
+    pass
+
+
+@dataclass(slots=True)
+class BlockIndexEntry:
+    """
+        A known block in the block tree, on the chain or on a side branch.
+    """
+    hash: str
+    previous_hash: Optional[str]
+    height: int
+    # Work of every block from the genesis block to this one
+    chain_work: int
+    # Kept for every block, headers are served without reading the block from the store
+    header: BlockHeader
+    # Set when the block failed validation while its branch was connected, its descendants are rejected
+    invalid: bool = False
+
+
 @dataclass
 class Blockchain:
     wallet: Wallet
@@ -22,107 +48,416 @@ class Blockchain:
         transactions=[],
     ))
     length: int = 1
+    utxo_set: UTXOSet = field(default_factory=UTXOSet)
+    mining_engine: MiningEngine = field(default_factory=MiningEngine)
+    # block hash -> block, with a block store only the most recent blocks are kept here
+    blocks_by_hash: Dict[str, Block] = field(default_factory=dict)
+    # block hash -> height, and height -> block hash, the genesis block is at height 1
+    block_heights: Dict[str, int] = field(default_factory=dict)
+    block_hashes_by_height: Dict[int, str] = field(default_factory=dict)
+    # transaction hash -> (block hash, position of the transaction in the block)
+    transaction_locations: Dict[str, Tuple[str, int]] = field(default_factory=dict)
+    # Blocks are persisted here when set, and previous_block links aren't kept so old blocks can leave memory
+    block_store: BlockStore = None
+    mempool: Mempool = field(default_factory=Mempool)
+    validation_cache: ValidationCache = field(default_factory=ValidationCache)
+    signature_verifier: SignatureVerifier = field(default_factory=SignatureVerifier)
+    # block hash -> entry of every known block, the heights above are those of the chain with the most work
+    block_index: Dict[str, BlockIndexEntry] = field(default_factory=dict)
+    # block hash -> outputs its transactions spent, for the last MAX_REORG_DEPTH blocks of the chain
+    block_undos: Dict[str, BlockUndo] = field(default_factory=dict)
+    orphans: OrphanPool = field(default_factory=OrphanPool)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
 
     def __post_init__(self):
         from src.core.blocks.block_validation import ProofOfWork
         if self.last_block:
-            genesis_nonce = ProofOfWork.find_nonce(self.last_block.header)
+            genesis_nonce = ProofOfWork.find_nonce(self.last_block.header, self.mining_engine)
             self.last_block.header.nonce = genesis_nonce
+            self.add_to_block_tree(self.last_block)
+            self.index_block(self.last_block, self.length)
+
+    @property
+    def chain_work(self) -> int:
+        return self.block_index[self.last_block.header.hash].chain_work if self.last_block else 0
 
-    def add_new_block(self, new_block: Block):
+    def add_to_block_tree(self, block: Block) -> BlockIndexEntry:
+        from src.core.blocks.block_validation import ProofOfWork
+        block_hash = block.header.hash
+        entry = self.block_index.get(block_hash)
+        if entry is not None:
+            return entry
+        parent = self.block_index.get(block.header.previous_hash)
+        entry = BlockIndexEntry(block_hash, block.header.previous_hash, parent.height + 1 if parent else 1,
+                                (parent.chain_work if parent else 0) + ProofOfWork.BLOCK_WORK, block.header)
+        # Stored before it is indexed, a block that fails to be written stays unknown
+        if self.block_store:
+            self.block_store.append(block, entry.height)
+        self.block_index[block_hash] = entry
+        self.blocks_by_hash[block_hash] = block
+        if self.block_store:
+            self.trim_block_cache()
+        return entry
+
+    def index_block(self, block: Block, height: int):
+        block_hash = block.header.hash
+        self.block_heights[block_hash] = height
+        self.block_hashes_by_height[height] = block_hash
+        for position, transaction in enumerate(block.transactions):
+            self.transaction_locations[transaction.hash] = (block_hash, position)
+
+    def unindex_block(self, block: Block, height: int):
+        block_hash = block.header.hash
+        del self.block_heights[block_hash]
+        del self.block_hashes_by_height[height]
+        for transaction in block.transactions:
+            if self.transaction_locations.get(transaction.hash, (None,))[0] == block_hash:
+                del self.transaction_locations[transaction.hash]
+
+    def trim_block_cache(self):
+        while len(self.blocks_by_hash) > BLOCK_CACHE_SIZE:
+            del self.blocks_by_hash[next(iter(self.blocks_by_hash))]
+
+    def attach_block_store(self, block_store: BlockStore):
+        """
+            Persists the blocks of an in memory chain and its side branches,
+            and keeps storing new blocks in the block store.
+        """
+        self.block_store = block_store
+        # Parents are indexed before their children, so the store can be read back in the same order
+        for entry in self.block_index.values():
+            block = self.blocks_by_hash[entry.hash]
+            block.previous_block = None
+            block_store.append(block, entry.height)
+        self.trim_block_cache()
+
+    def connect_block(self, new_block: Block):
+        """
+            Changes nothing on the chain unless the block is stored and its outputs applied.
+        """
+        self.add_to_block_tree(new_block)
+        block_hash = new_block.header.hash
+        self.block_undos[block_hash] = self.utxo_set.apply_block(new_block)
+        if not self.block_store:
+            new_block.previous_block = self.last_block
+        self.mempool.remove_block_transactions(new_block)
+        self.last_block = new_block
+        self.length += 1
+        self.index_block(new_block, self.length)
+        self.block_undos.pop(self.block_hashes_by_height.get(self.length - MAX_REORG_DEPTH), None)
+        for transaction in new_block.transactions:
+            # Validated and indexed, the serialized forms are only rebuilt for a merkle proof
+            transaction.release_serialized_data()
+
+    def disconnect_last_block(self) -> Block:
+        """
+            Takes the last block off the chain and reverts its outputs, the block stays in the block tree.
+        """
+        block = self.last_block
+        block_hash = block.header.hash
+        block_undo = self.block_undos.pop(block_hash, None)
+        if block_undo is None:
+            raise BlockchainException(f"Block {block_hash} is too deep to be disconnected")
+        self.utxo_set.undo_block(block, block_undo)
+        self.unindex_block(block, self.length)
+        self.length -= 1
+        self.last_block = self.get_block_by_height(self.length)
+        block.previous_block = None
+        return block
+
+    def add_new_block(self, new_block: Block, validation: 'BlockValidation' = None):
+        """
+            Connects a block that extends the last block after validating it.
+            A validation that already ran for this block on top of the current last block is reused as is.
+
+            A block that extends any other known block goes to a side branch,
+            which becomes the chain once it has more work. A block whose parent is unknown waits in the orphan pool,
+            and the orphans waiting on the new block are added after it.
+        """
+        with self.lock:
+            self.add_block(new_block, validation)
+            self.connect_orphans(new_block)
+            return new_block
+
+    def add_block(self, new_block: Block, validation: 'BlockValidation' = None):
         from src.core.blocks.block_validation import BlockValidation, BlockException
         from src.core.transactions.transaction_validation import TransactionValidationException
+        if self.last_block and new_block.header.previous_hash != self.last_block.header.hash:
+            return self.add_side_block(new_block)
+        block_hash = new_block.header.hash
+        if block_hash in self.block_index:
+            # The tree keeps the copy it has, another body with the same header must not be connected
+            raise BlockchainException(f"Block {block_hash} is already known")
         try:
-            validate_block = BlockValidation(blockchain=self, block=new_block)
-            validate_block.validate()
-            new_block.previous_block = self.last_block
-            self.last_block = new_block
-            self.length += 1
+            if not (validation and validation.is_valid_for(self, new_block)):
+                validate_block = BlockValidation(blockchain=self, block=new_block)
+                validate_block.validate()
+            self.connect_block(new_block)
             return new_block
         except (BlockException, TransactionValidationException) as e:
             print(e)
-            raise BlockchainException("", "Invalid blockchain")
-
-    def get_transaction_from_utxo(self, tx_hash: str) -> Transaction:
-        current_block = self.last_block
-        while current_block:
-            found_transaction = current_block.find_transaction_by_hash(tx_hash)
-            if found_transaction:
-                return copy.deepcopy(found_transaction)
-            current_block = current_block.previous_block
+            raise BlockchainException(f"{e}")
+
+    def connect_orphans(self, block: Block) -> List[Block]:
+        """
+            Adds the orphans waiting on the block, then the orphans waiting on those, and so on.
+        """
+        added_orphans = []
+        parent_hashes = [block.header.hash]
+        while parent_hashes:
+            for orphan in self.orphans.pop_children(parent_hashes.pop()):
+                try:
+                    self.add_block(orphan)
+                except BlockchainException as e:
+                    print(f"Dropping orphan block {orphan.header.hash}: {e}")
+                    continue
+                added_orphans.append(orphan)
+                parent_hashes.append(orphan.header.hash)
+        if added_orphans:
+            print(f"Added {len(added_orphans)} orphan blocks after block {block.header.hash}")
+        return added_orphans
+
+    def add_side_block(self, new_block: Block) -> Block:
+        """
+            Adds a block to a side branch after the checks that don't need the branch state,
+            and reorganizes the chain when the branch has more work than it.
+            A block with an unknown parent goes to the orphan pool instead.
+        """
+        from src.core.blocks.block_validation import BlockValidation, BlockException
+        block_hash = new_block.header.hash
+        if block_hash in self.block_index:
+            raise BlockchainException(f"Block {block_hash} is already known")
+        try:
+            BlockValidation(blockchain=self, block=new_block).validate_proof()
+        except BlockException as e:
+            raise BlockchainException(f"{e}")
+        parent = self.block_index.get(new_block.header.previous_hash)
+        if parent is None:
+            self.orphans.add(new_block)
+            raise OrphanBlockException(f"Previous block {new_block.header.previous_hash} is unknown, "
+                                       f"block kept until it arrives")
+        if parent.invalid:
+            raise BlockchainException(f"Previous block {parent.hash} is invalid")
+        entry = self.add_to_block_tree(new_block)
+        if entry.chain_work > self.chain_work:
+            self.reorganize(entry)
+        else:
+            print(f"Block {block_hash} added to a side branch at height {entry.height}")
+        return new_block
+
+    def reorganize(self, new_tip: BlockIndexEntry):
+        """
+            Switches the chain to the branch ending with new_tip.
+
+            Blocks are disconnected down to the last block both branches share, then the blocks of the branch are
+            validated and connected one by one. When one of them is invalid, the previous chain is connected back.
+            Transactions of the blocks that left the chain return to the mempool.
+        """
+        from src.core.blocks.block_validation import BlockValidation, BlockException
         from src.core.transactions.transaction_validation import TransactionValidationException
-        raise TransactionValidationException("UTXO not found")
-
-    def get_transaction_fees(self, transactions: List[Transaction]) -> float:
-        transaction_fees = 0
-        for transaction in transactions:
-            input_amount = 0
-            output_amount = 0
-            for transaction_input in transaction.inputs:
-                utxo = self.get_transaction_from_utxo(
-                    transaction_input.transaction_hash)
-                if utxo:
-                    utxo_amount = utxo.outputs[transaction_input.output_index].amount
-                    input_amount = input_amount + utxo_amount
-            for transaction_output in transaction.outputs:
-                output_amount = output_amount + transaction_output.amount
-            transaction_fees = transaction_fees + (input_amount-output_amount)
-        return transaction_fees
+        branch = []
+        entry = new_tip
+        while entry.hash not in self.block_heights:
+            if entry.invalid:
+                raise BlockchainException(f"Branch of block {new_tip.hash} contains invalid block {entry.hash}")
+            branch.append(entry)
+            entry = self.block_index.get(entry.previous_hash)
+            if entry is None:
+                raise BlockchainException(f"Branch of block {new_tip.hash} doesn't join the chain")
+        fork_height = entry.height
+        if self.length - fork_height > MAX_REORG_DEPTH:
+            raise BlockchainException(f"Branch of block {new_tip.hash} forks {self.length - fork_height} blocks deep")
+        print(f"Reorganizing from height {fork_height + 1}: {self.length - fork_height} blocks out, "
+              f"{len(branch)} blocks in")
+        disconnected_blocks = []
+        while self.length > fork_height:
+            disconnected_blocks.insert(0, self.disconnect_last_block())
+        connected_blocks = []
+        try:
+            for entry in reversed(branch):
+                block = self.get_block_by_hash(entry.hash)
+                BlockValidation(blockchain=self, block=block).validate()
+                self.connect_block(block)
+                connected_blocks.append(block)
+        except (BlockException, TransactionValidationException) as e:
+            # The block and the blocks built on it can't be part of the chain
+            for invalid_entry in branch[:branch.index(entry) + 1]:
+                invalid_entry.invalid = True
+            while self.length > fork_height:
+                self.disconnect_last_block()
+            for block in disconnected_blocks:
+                self.connect_block(block)
+            self.return_to_mempool(connected_blocks)
+            raise BlockchainException(f"Block {entry.hash} of the new branch is invalid - {e}")
+        self.return_to_mempool(disconnected_blocks)
+
+    def return_to_mempool(self, blocks: List[Block]):
+        """
+            Puts back the transactions of blocks that left the chain, unless the chain has them again
+            or they no longer spend unspent outputs.
+        """
+        from src.core.transactions.transaction_validation import TransactionValidation, \
+            TransactionValidationException
+        for block in blocks:
+            for transaction in block.transactions:
+                if transaction.is_coin_base or transaction.hash in self.transaction_locations \
+                        or transaction.hash in self.mempool:
+                    continue
+                try:
+                    TransactionValidation(blockchain=self, transaction=transaction,
+                                          utxo_set=MempoolUTXOView(self.utxo_set, self.mempool)).validate()
+                    self.mempool.add(transaction)
+                except (TransactionValidationException, MempoolException) as e:
+                    print(f"Dropping transaction {transaction.hash} of a disconnected block: {e}")
+
+    def get_utxo(self, tx_hash: str, output_index: int) -> TransactionOutput:
+        utxo = self.utxo_set.get(tx_hash, output_index)
+        if utxo is None:
+            from src.core.transactions.transaction_validation import TransactionValidationException
+            raise TransactionValidationException("UTXO not found or already spent")
+        return utxo
+
+    def create_block_candidate(self, transactions: List[Transaction] = None) -> Tuple[Block, 'BlockValidation']:
+        """
+            Block on top of the last block with the transactions, the mempool ones by default, and the coinbase.
+            Its nonce is still to be found, the validation is handed to add_new_block once it is.
+        """
+        from src.core.blocks.block_template import BlockTemplateBuilder
+        from src.core.blocks.block_validation import BlockValidation, ProofOfWork
+        from_mempool = transactions is None
+        with self.lock:
+            if from_mempool:
+                transactions = self.mempool.get_transactions()
+            template = BlockTemplateBuilder(self).build(transactions)
+            if from_mempool:
+                for transaction in template.invalid_transactions:
+                    self.mempool.remove(transaction.hash)
+            if len(template.transactions) == 0:
+                print("Warning: Transaction list is empty")
+            valid_transactions = list(template.transactions)
+            transaction_fees = template.transaction_fees
+            coinbase_transaction = ProofOfWork.get_coin_base_transaction(
+                transaction_fees, miner_wallet=self.wallet)
+            valid_transactions.append(coinbase_transaction)
+            merkle_root = MerkleTree.compute_root([tx.merkle_leaf_bytes for tx in valid_transactions])
+            block_header = BlockHeader(
+                index=self.length + 1,
+                merkle_root=merkle_root,
+                previous_hash=self.last_block.header.hash,
+            )
+            new_block = Block(transactions=valid_transactions, header=block_header)
+            return new_block, BlockValidation.for_template(self, new_block, transaction_fees)
 
     def create_new_block(self, transactions: List[Transaction] = None):
-        from src.core.blocks.block_validation import ProofOfWork
-        if transactions is None:
-            transactions = get_transactions_from_memory()
-            transactions = [Transaction.from_json(
-                transaction) for transaction in transactions]
-        from src.core.transactions.transaction_validation import TransactionValidation, TransactionValidationException
-        valid_transactions = []
-        for transaction in transactions:
-            try:
-                validate = TransactionValidation(
-                    transaction=transaction, blockchain=self)
-                validate.validate()
-                valid_transactions.append(transaction)
-            except TransactionValidationException as e:
-                print(f"Transaction validation failed: {e}")
-                print("Skipping")
-        if len(valid_transactions) == 0:
-            print("Warning: Transaction list is empty")
-        transaction_fees = self.get_transaction_fees(valid_transactions)
-        coinbase_transaction = ProofOfWork.get_coin_base_transaction(
-            transaction_fees, miner_wallet=self.wallet)
-        valid_transactions.append(coinbase_transaction)
-        merkle_tree = MerkleTree(
-            [json.dumps(tx.to_dict_no_script).encode('utf-8') for tx in valid_transactions])
-        block_header = BlockHeader(
-            index=self.length + 1,
-            merkle_root=merkle_tree.root.value,
-            previous_hash=self.last_block.header.hash,
-        )
-        nonce = ProofOfWork.find_nonce(block_header)
-        block_header.nonce = nonce
-        new_block = Block(transactions=valid_transactions, header=block_header)
-        self.add_new_block(new_block)
-        reset_transaction_memory()
+        new_block, validation = self.create_block_candidate(transactions)
+        block_header = new_block.header
+        mining_result = self.mining_engine.mine(block_header)
+        print(f"Found nonce for block {block_header.index} after {mining_result.attempts} attempts - "
+              f"{mining_result.hashes_per_second:.0f} H/s on {mining_result.workers} workers")
+        block_header.nonce = mining_result.nonce
+        self.add_new_block(new_block, validation)
         return new_block
 
-    def get_block_by_hash(self, hash: str):
-        current_block = self.last_block
-        while current_block:
-            if current_block.header.hash == hash:
-                return current_block
-            current_block = current_block.previous_block
-        return None
+    def get_block_by_hash(self, hash: str) -> Optional[Block]:
+        block = self.blocks_by_hash.get(hash)
+        if block is None and self.block_store and hash in self.block_index:
+            block = self.block_store.read_block(hash)
+        return block
+
+    def get_header_by_hash(self, block_hash: str) -> Optional[BlockHeader]:
+        entry = self.block_index.get(block_hash)
+        return entry.header if entry else None
+
+    def get_encoded_block(self, block_hash: str) -> Optional[bytes]:
+        """
+            Binary encoding of a block, a block that is only on disk isn't decoded.
+        """
+        if block_hash not in self.blocks_by_hash and self.block_store and block_hash in self.block_index:
+            return self.block_store.read_encoded_block(block_hash)
+        block = self.blocks_by_hash.get(block_hash)
+        return block.to_bytes if block else None
+
+    def get_block_by_height(self, height: int) -> Optional[Block]:
+        block_hash = self.block_hashes_by_height.get(height)
+        if block_hash is None:
+            return None
+        return self.get_block_by_hash(block_hash)
+
+    def get_block_height(self, block_hash: str) -> Optional[int]:
+        return self.block_heights.get(block_hash)
+
+    def iter_blocks(self) -> Iterator[Block]:
+        """
+            Blocks of the chain from the last block to the genesis block.
+        """
+        for height in range(self.length, 0, -1):
+            yield self.get_block_by_height(height)
+
+    def get_locator(self) -> List[str]:
+        """
+            Hashes of the last 10 blocks, then of blocks further and further back down to the genesis block.
+            A peer finds where its chain forks from this one with the first hash it knows.
+        """
+        locator = []
+        height = self.length
+        step = 1
+        while height > 1:
+            locator.append(self.block_hashes_by_height[height])
+            if len(locator) >= 10:
+                step *= 2
+            height -= step
+        if self.length:
+            locator.append(self.block_hashes_by_height[1])
+        return locator
+
+    def get_locator_height(self, locator: List[str]) -> int:
+        """
+            Height of the first hash of a peer locator that is in the chain, 0 when none is.
+        """
+        for block_hash in locator:
+            height = self.block_heights.get(block_hash)
+            if height is not None:
+                return height
+        return 0
+
+    def get_transaction_location(self, tx_hash: str) -> Optional[Tuple[Block, int]]:
+        location = self.transaction_locations.get(tx_hash)
+        if location is None:
+            return None
+        block_hash, position = location
+        return self.get_block_by_hash(block_hash), position
 
     @staticmethod
     def from_json_list(blockchain_dict: List[dict], wallet: Wallet):
+        return Blockchain.from_block_list([Block.from_json(block) for block in blockchain_dict], wallet)
+
+    @staticmethod
+    def from_block_list(blocks: List[Block], wallet: Wallet):
         try:
             # The blockchain comes with the genesis block at the end due to the linked list nature
             new_blockchain = Blockchain(wallet, None, 0)
-            for block in reversed(blockchain_dict):
-                block = Block.from_json(block)
+            for block in reversed(blocks):
                 new_blockchain.add_new_block(block)
             return new_blockchain
         except BlockchainException:
             print("Received invalid blockchain")
             return None
+
+    @staticmethod
+    def from_block_store(block_store: BlockStore, wallet: Wallet, mempool: Mempool = None) -> 'Blockchain':
+        """
+            Rebuilds the chain state and the side branches from the blocks on disk, in the order they were received.
+            Blocks that extended the chain were validated before being written, so proof of work and scripts aren't
+            checked again. Side blocks are, when their branch takes over the chain like it did when they arrived.
+            A given mempool is attached first, so the transactions of the replayed blocks leave it.
+        """
+        new_blockchain = Blockchain(wallet, None, 0, block_store=block_store, mempool=mempool or Mempool())
+        for block, height in block_store.iter_blocks():
+            if new_blockchain.last_block is None or block.header.previous_hash == new_blockchain.last_block.header.hash:
+                new_blockchain.connect_block(block)
+                continue
+            try:
+                new_blockchain.add_side_block(block)
+            except BlockchainException as e:
+                print(f"Skipping stored block {block.header.hash}: {e}")
+        return new_blockchain
@@ -1,18 +1,28 @@
+import hashlib
 import json
 import time
 from dataclasses import dataclass, field
 from typing import List
 
 from src.core.transactions.transaction import Transaction
-from src.utils.crypto_utils import calculate_sha256
 
-@dataclass
+@dataclass(slots=True)
 class BlockHeader:
     index: int
     previous_hash: str = None
     merkle_root: str = None
     nonce: int = 0
     timestamp: float = field(default_factory=lambda: time.time())
+    # Cached hash, the same string is shared by the chain indexes
+    _hash: str = field(default=None, init=False, repr=False, compare=False)
+
+    HASHED_FIELDS = ('index', 'previous_hash', 'merkle_root', 'nonce', 'timestamp')
+
+    def __setattr__(self, name, value):
+        # object.__setattr__ since super() doesn't work in a slotted dataclass
+        object.__setattr__(self, name, value)
+        if name in BlockHeader.HASHED_FIELDS:
+            object.__setattr__(self, '_hash', None)
 
     @property
     def to_dict(self) -> dict:
@@ -28,10 +38,24 @@ class BlockHeader:
     def from_json(block_header: dict) -> 'BlockHeader':
         return BlockHeader(block_header['index'], block_header['previous_hash'], block_header['merkle_root'], block_header['nonce'], block_header['timestamp'])
 
+    @property
+    def to_bytes(self) -> bytes:
+        from src.core.serialization import encode_header
+        return encode_header(self)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'BlockHeader':
+        from src.core.serialization import decode_header
+        return decode_header(data)
+
     @property
     def hash(self) -> str:
-        block_string = json.dumps(self.to_dict, sort_keys=True).encode()
-        return calculate_sha256(block_string)
+        block_hash = self._hash
+        if block_hash is None:
+            block_string = json.dumps(self.to_dict, sort_keys=True).encode()
+            block_hash = hashlib.sha256(block_string).hexdigest()
+            self._hash = block_hash
+        return block_hash
 
     def __eq__(self, other: 'BlockHeader') -> bool:
         return (
@@ -43,7 +67,33 @@ class BlockHeader:
         )
 
 
-@dataclass
+class BlockHeaderHasher:
+    """
+        Fast hashing path for a header whose fields are fixed except for the nonce.
+
+        The header is serialized once the same way as BlockHeader.hash, split around the nonce value,
+        and the SHA-256 state of the part before the nonce is kept so each attempt only hashes the nonce and the rest.
+    """
+    NONCE_PLACEHOLDER = '"nonce": null'
+
+    def __init__(self, block_header: BlockHeader):
+        header_dict = {**block_header.to_dict, 'nonce': None}
+        header_string = json.dumps(header_dict, sort_keys=True)
+        prefix, placeholder, suffix = header_string.partition(self.NONCE_PLACEHOLDER)
+        self.prefix = (prefix + '"nonce": ').encode()
+        self.suffix = suffix.encode()
+        self.midstate = hashlib.sha256(self.prefix)
+
+    def digest(self, nonce: int) -> bytes:
+        hash_obj = self.midstate.copy()
+        hash_obj.update(b"%d%s" % (nonce, self.suffix))
+        return hash_obj.digest()
+
+    def hash(self, nonce: int) -> str:
+        return self.digest(nonce).hex()
+
+
+@dataclass(slots=True)
 class Block:
     header: BlockHeader
     transactions: List[Transaction]
@@ -70,6 +120,16 @@ class Block:
         transactions = [Transaction.from_json(transaction) for transaction in block['transactions']]
         return Block(header, transactions)
 
+    @property
+    def to_bytes(self) -> bytes:
+        from src.core.serialization import encode_block
+        return encode_block(self)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'Block':
+        from src.core.serialization import decode_block
+        return decode_block(data)
+
     def __eq__(self, other: 'Block') -> bool:
         return (
             self.header == other.header and
@@ -0,0 +1,85 @@
+import heapq
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from src.core.transactions.transaction import Transaction
+from src.core.transactions.transaction_validation import TransactionValidation, TransactionValidationException
+from src.core.utxo_set import UTXOView
+from src.utils.consts import MAX_BLOCK_SIZE, MAX_BLOCK_TRANSACTIONS
+
+
+@dataclass
+class BlockTemplate:
+    transactions: List[Transaction] = field(default_factory=list)
+    transaction_fees: float = 0
+    size: int = 0
+    # Candidates that failed validation and should leave the mempool
+    invalid_transactions: List[Transaction] = field(default_factory=list)
+
+
+class BlockTemplateBuilder:
+    """
+        Picks the transactions of a new block by fee per serialized byte.
+
+        Candidates are validated when all of their in-pool parents are in the template, so a child can follow its
+        parent in the same block. A max-heap on fee rate then decides which ready transaction goes in next,
+        until the size or transaction count limit is reached. Fees are computed in the validation pass.
+    """
+    def __init__(self, blockchain, max_block_size: int = MAX_BLOCK_SIZE,
+                 max_block_transactions: int = MAX_BLOCK_TRANSACTIONS):
+        self.blockchain = blockchain
+        self.max_block_size = max_block_size
+        self.max_block_transactions = max_block_transactions
+
+    def build(self, transactions: List[Transaction]) -> BlockTemplate:
+        template = BlockTemplate()
+        utxo_view = UTXOView(self.blockchain.utxo_set)
+        candidates: Dict[str, Transaction] = {transaction.hash: transaction for transaction in transactions}
+        arrival_order = {tx_hash: position for position, tx_hash in enumerate(candidates)}
+        missing_parents: Dict[str, Set[str]] = {}
+        children: Dict[str, List[str]] = {tx_hash: [] for tx_hash in candidates}
+        for tx_hash, transaction in candidates.items():
+            parents = {tx_input.transaction_hash for tx_input in transaction.inputs
+                       if tx_input.transaction_hash in candidates and tx_input.transaction_hash != tx_hash}
+            missing_parents[tx_hash] = parents
+            for parent_hash in parents:
+                children[parent_hash].append(tx_hash)
+
+        # Entries are (-fee rate, arrival position, hash, fee, size) so the best fee rate pops first
+        ready = []
+
+        def push_if_valid(tx_hash: str):
+            transaction = candidates[tx_hash]
+            try:
+                validate = TransactionValidation(transaction=transaction, blockchain=self.blockchain,
+                                                 utxo_set=utxo_view)
+                validate.validate()
+            except TransactionValidationException as e:
+                print(f"Transaction validation failed: {e}")
+                template.invalid_transactions.append(transaction)
+                return
+            size = transaction.size
+            heapq.heappush(ready, (-validate.fee / size, arrival_order[tx_hash], tx_hash, validate.fee, size))
+
+        for tx_hash, parents in missing_parents.items():
+            if not parents:
+                push_if_valid(tx_hash)
+
+        while ready and len(template.transactions) < self.max_block_transactions:
+            _, _, tx_hash, fee, size = heapq.heappop(ready)
+            transaction = candidates[tx_hash]
+            if template.size + size > self.max_block_size:
+                continue
+            if any(utxo_view.get(*outpoint) is None for outpoint in transaction.outpoints):
+                # Another transaction of the template already spent one of its outputs
+                template.invalid_transactions.append(transaction)
+                continue
+            utxo_view.apply_transaction(transaction)
+            template.transactions.append(transaction)
+            template.transaction_fees = template.transaction_fees + fee
+            template.size = template.size + size
+            for child_hash in children[tx_hash]:
+                missing_parents[child_hash].discard(tx_hash)
+                if not missing_parents[child_hash]:
+                    push_if_valid(child_hash)
+        return template
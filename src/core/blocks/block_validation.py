@@ -1,8 +1,11 @@
-import copy
+from typing import List
 
 from src.core.blocks.block import BlockHeader, Block
+from src.core.blocks.mining import MiningEngine
+from src.core.merkle_tree import MerkleTree
 from src.core.transactions.transaction import Transaction, TransactionOutput
 from src.core.transactions.transaction_validation import TransactionValidation, TransactionValidationException
+from src.core.utxo_set import UTXOView
 from src.utils.consts import NUMBER_OF_LEADING_ZEROS_IN_HASH, MINER_REWARD
 from src.wallet.wallet import Wallet
 
@@ -16,23 +19,30 @@ class BlockException(Exception):
         return self.message
 
 class ProofOfWork:
+    VALID_HASH_PREFIX = "0" * NUMBER_OF_LEADING_ZEROS_IN_HASH
+    # The same requirement on the raw digest: whole zero bytes, then a byte below 0x10 for an odd number of zeros
+    VALID_DIGEST_PREFIX = bytes(NUMBER_OF_LEADING_ZEROS_IN_HASH // 2)
+    HAS_HALF_ZERO_BYTE = NUMBER_OF_LEADING_ZEROS_IN_HASH % 2 == 1
+    # Hashes expected to find a valid nonce, the work a block adds to its chain
+    BLOCK_WORK = 16 ** NUMBER_OF_LEADING_ZEROS_IN_HASH
+
     def __init__(self):
         pass
 
     @staticmethod
     def is_valid_nonce(block_header: BlockHeader):
-        block_header_hash = block_header.hash
-        desired_starting_zeros = "".join([str(0) for _ in range(NUMBER_OF_LEADING_ZEROS_IN_HASH)])
-        return block_header_hash.startswith(desired_starting_zeros)
+        return block_header.hash.startswith(ProofOfWork.VALID_HASH_PREFIX)
+
+    @staticmethod
+    def is_valid_digest(digest: bytes) -> bool:
+        if not digest.startswith(ProofOfWork.VALID_DIGEST_PREFIX):
+            return False
+        return not ProofOfWork.HAS_HALF_ZERO_BYTE or digest[len(ProofOfWork.VALID_DIGEST_PREFIX)] < 0x10
 
     @staticmethod
-    def find_nonce(block_header: BlockHeader):
-        header_copy = copy.deepcopy(block_header)
-        nonce = header_copy.nonce
-        while not ProofOfWork.is_valid_nonce(header_copy):
-            nonce += 1
-            header_copy.nonce = nonce
-        return nonce
+    def find_nonce(block_header: BlockHeader, mining_engine: MiningEngine = None):
+        mining_engine = mining_engine or MiningEngine()
+        return mining_engine.mine(block_header).nonce
 
     @staticmethod
     def get_coin_base_transaction(transaction_fees: float, miner_wallet: Wallet) -> Transaction:
@@ -45,6 +55,23 @@ class BlockValidation:
     def __init__(self, blockchain: Blockchain, block: Block):
         self.blockchain = blockchain
         self.block = block
+        self.transaction_fees = 0
+        # Hash of the last block this block was successfully validated on top of
+        self.validated_on = None
+
+    def validate_field_types(self):
+        header = self.block.header
+        # The hashes of the genesis block are None
+        if type(header.index) is not int or type(header.nonce) is not int \
+                or type(header.timestamp) not in (int, float) \
+                or type(header.previous_hash) not in (str, type(None)) \
+                or type(header.merkle_root) not in (str, type(None)):
+            raise BlockException("Invalid block header fields")
+        try:
+            for tx in self.block.transactions:
+                TransactionValidation.validate_field_types(tx)
+        except TransactionValidationException as e:
+            raise BlockException(f"Transaction {tx.hash}: {e}")
 
     def validate_prev_block(self):
         if not (self.blockchain.last_block.header.hash == self.block.header.previous_hash):
@@ -54,17 +81,115 @@ class BlockValidation:
         if not ProofOfWork.is_valid_nonce(self.block.header):
             raise BlockException("Invalid hash")
 
+    def validate_merkle_root(self):
+        merkle_root = MerkleTree.compute_root([tx.merkle_leaf_bytes for tx in self.block.transactions])
+        if merkle_root != self.block.header.merkle_root:
+            raise BlockException("Invalid merkle root")
+
+    def validate_double_spend(self):
+        spent_outpoints = set()
+        for tx in self.block.transactions:
+            outpoints = tx.outpoints
+            if not spent_outpoints.isdisjoint(outpoints):
+                raise BlockException("Double spend in block")
+            spent_outpoints.update(outpoints)
+
+    def validate_coin_base(self):
+        """
+            The only coinbase transaction of a block is its last one, it has no inputs and pays at most
+            the miner reward plus the fees of the other transactions.
+        """
+        transactions = self.block.transactions
+        if any(tx.is_coin_base for tx in transactions[:-1]):
+            raise BlockException("Coinbase transaction must be the last transaction of the block")
+        if not (transactions and transactions[-1].is_coin_base):
+            return
+        coin_base = transactions[-1]
+        if coin_base.inputs:
+            raise BlockException("Coinbase transaction can't have inputs")
+        if sum(tx_output.amount for tx_output in coin_base.outputs) > self.transaction_fees + MINER_REWARD:
+            raise BlockException("Coinbase transaction pays more than the block reward")
+
     def validate_transactions(self):
+        """
+            Validates the transactions in block order, a transaction can spend outputs of the transactions before it.
+            The fees are collected in the same pass for the coinbase check.
+        """
+        self.validate_double_spend()
+        utxo_view = UTXOView(self.blockchain.utxo_set)
+        self.transaction_fees = 0
+        transaction_validations = []
         try:
             for tx in self.block.transactions:
-                validate = TransactionValidation(transaction=tx, blockchain=self.blockchain)
+                validate = TransactionValidation(transaction=tx, blockchain=self.blockchain,
+                                                 allow_coin_base=tx is self.block.transactions[-1],
+                                                 utxo_set=utxo_view, defer_signatures=True)
                 validate.validate()
-        except TransactionValidationException:
+                transaction_validations.append(validate)
+                utxo_view.apply_transaction(tx)
+                self.transaction_fees = self.transaction_fees + validate.fee
+            self.validate_signatures(transaction_validations)
+        except TransactionValidationException as e:
+            print(e)
             raise BlockException("Invalid transactions")
+        self.validate_coin_base()
+
+    def validate_signatures(self, transaction_validations: List[TransactionValidation]):
+        """
+            Verifies the signatures of every transaction of the block in one batch.
+        """
+        signature_jobs = [job for validate in transaction_validations for _, job in validate.signature_jobs]
+        signature_results = self.blockchain.signature_verifier.verify(signature_jobs)
+        for validate in transaction_validations:
+            try:
+                validate.check_signature_results(signature_results)
+            except TransactionValidationException as e:
+                raise TransactionValidationException(f"Transaction {validate.transaction.hash}: {e}")
+
+    def validate_proof(self):
+        """
+            Checks that don't depend on the chain state, a block of a side branch only passes these
+            until its branch is connected.
+        """
+        self.validate_field_types()
+        # A known header skips the proof of work check, the merkle root still ties this body to it
+        if not self.blockchain.validation_cache.has_valid_block(self.block.header.hash):
+            self.validate_hash()
+        self.validate_merkle_root()
 
     def validate(self):
+        self.validated_on = None
+        last_block_hash = self.blockchain.last_block.header.hash if self.blockchain.last_block else None
         if self.blockchain.last_block:
             self.validate_prev_block()
-        self.validate_hash()
+        block_hash = self.block.header.hash
+        # Scripts are cached per transaction
+        self.validate_proof()
         self.validate_transactions()
+        self.blockchain.validation_cache.add_valid_block(block_hash)
+        self.validated_on = last_block_hash
+        return self
+
+    @staticmethod
+    def for_template(blockchain: Blockchain, block: Block, transaction_fees: float) -> 'BlockValidation':
+        """
+            Validation of a block the blockchain built from a block template on its current last block.
+            The template builder validated the transactions against that chain state and the coinbase and merkle root
+            are built from them, only the proof of work is left, it is checked once the nonce is found.
+        """
+        validation = BlockValidation(blockchain=blockchain, block=block)
+        validation.transaction_fees = transaction_fees
+        validation.validated_on = blockchain.last_block.header.hash
+        return validation
+
+    def is_valid_for(self, blockchain: Blockchain, block: Block) -> bool:
+        """
+            True when this validation passed for the block on the current last block of the blockchain,
+            the chain state it checked against hasn't changed since.
+        """
+        if not (self.blockchain is blockchain and self.block is block and self.validated_on is not None):
+            return False
+        if not ProofOfWork.is_valid_nonce(block.header):
+            return False
+        return blockchain.last_block is not None and blockchain.last_block.header.hash == self.validated_on
 
@@ -0,0 +1,171 @@
+import multiprocessing
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+from src.core.blocks.block import BlockHeader, BlockHeaderHasher
+from src.utils.consts import MINING_WORKERS
+
+# Number of nonces a worker tries before checking whether another worker already found one
+NONCE_BATCH_SIZE = 5000
+# Seconds between two checks of the workers results, and of whether the search was cancelled
+RESULTS_POLL_INTERVAL = 0.1
+
+
+class MiningException(Exception):
+    pass
+
+
+@dataclass
+class MiningResult:
+    nonce: int
+    attempts: int
+    elapsed: float
+    workers: int
+
+    @property
+    def hashes_per_second(self) -> float:
+        if self.elapsed <= 0:
+            return float(self.attempts)
+        return self.attempts / self.elapsed
+
+    @property
+    def cancelled(self) -> bool:
+        return self.nonce is None
+
+
+def search_nonce_range(block_header: BlockHeader, start: int, step: int, found_event=None,
+                       attempts_counter=None) -> tuple:
+    """
+        Tries the nonces start, start + step, start + 2 * step, ... until a valid one is found
+        or found_event is set by another worker. Each batch of attempts is added to the shared attempts_counter.
+
+        Returns a (nonce, attempts) tuple, nonce is None when the search was stopped.
+    """
+    from src.core.blocks.block_validation import ProofOfWork
+    digest = BlockHeaderHasher(block_header).digest
+    is_valid_digest = ProofOfWork.is_valid_digest
+    nonce = start
+    attempts = 0
+    while not (found_event and found_event.is_set()):
+        for _ in range(NONCE_BATCH_SIZE):
+            attempts += 1
+            if is_valid_digest(digest(nonce)):
+                return nonce, attempts
+            nonce += step
+        if attempts_counter is not None:
+            with attempts_counter.get_lock():
+                attempts_counter.value += NONCE_BATCH_SIZE
+    return None, attempts
+
+
+def mining_worker(block_header: BlockHeader, start: int, step: int, found_event, results, attempts_counter):
+    nonce, attempts = search_nonce_range(block_header, start, step, found_event, attempts_counter)
+    if nonce is not None:
+        found_event.set()
+    results.put((nonce, attempts))
+
+
+class MiningEngine:
+    """
+        Proof of work search split across a pool of worker processes.
+
+        Worker i tries the nonces start + i, start + i + workers, ... so the workers never overlap,
+        and all of them stop as soon as one finds a valid nonce, or when the search is cancelled.
+        The attempts of a running search are counted in shared memory, for its progress.
+    """
+    def __init__(self, workers: int = MINING_WORKERS):
+        if workers < 1:
+            raise MiningException("Mining engine needs at least one worker")
+        self.workers = workers
+        self.last_result: MiningResult = None
+        # Attempts and start time of the running search, None between searches
+        self.attempts_counter = None
+        self.started_at: float = None
+
+    @staticmethod
+    def get_process_context():
+        # Workers are forked so they don't have to re-import the server module, platforms without fork mine in process
+        if "fork" in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context("fork")
+        return None
+
+    @property
+    def progress(self) -> dict:
+        attempts_counter, started_at = self.attempts_counter, self.started_at
+        if attempts_counter is None:
+            return {"mining": False, "attempts": 0, "elapsed": 0, "hashes_per_second": 0, "workers": self.workers}
+        attempts = attempts_counter.value
+        elapsed = time.perf_counter() - started_at
+        return {
+            "mining": True,
+            "attempts": attempts,
+            "elapsed": elapsed,
+            "hashes_per_second": attempts / elapsed if elapsed > 0 else 0,
+            "workers": self.workers,
+        }
+
+    def mine(self, block_header: BlockHeader, cancel_event: threading.Event = None) -> MiningResult:
+        """
+            Searches a nonce until one is found or cancel_event is set, the nonce of a cancelled search is None.
+        """
+        context = self.get_process_context()
+        self.attempts_counter = (context or multiprocessing).Value("Q", 0)
+        self.started_at = start_time = time.perf_counter()
+        try:
+            if self.workers == 1 or context is None:
+                nonce, attempts = search_nonce_range(block_header, block_header.nonce, 1, cancel_event,
+                                                     self.attempts_counter)
+                workers = 1
+            else:
+                nonce, attempts = self.mine_in_pool(context, block_header, cancel_event)
+                workers = self.workers
+        finally:
+            self.attempts_counter = None
+        self.last_result = MiningResult(nonce=nonce, attempts=attempts,
+                                        elapsed=time.perf_counter() - start_time, workers=workers)
+        return self.last_result
+
+    def mine_in_pool(self, context, block_header: BlockHeader, cancel_event: threading.Event = None) -> tuple:
+        found_event = context.Event()
+        results = context.Queue()
+        processes = [
+            context.Process(target=mining_worker,
+                            args=(block_header, block_header.nonce + i, self.workers, found_event, results,
+                                  self.attempts_counter),
+                            daemon=True)
+            for i in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        found_nonces = []
+        total_attempts = 0
+        pending_workers = len(processes)
+        try:
+            while pending_workers:
+                if cancel_event and cancel_event.is_set():
+                    # The workers see it at the end of their batch and report what they tried
+                    found_event.set()
+                try:
+                    nonce, attempts = results.get(timeout=RESULTS_POLL_INTERVAL)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    continue
+                pending_workers -= 1
+                total_attempts += attempts
+                if nonce is not None:
+                    found_nonces.append(nonce)
+        finally:
+            found_event.set()
+            for process in processes:
+                process.join()
+
+        if not found_nonces:
+            if cancel_event and cancel_event.is_set():
+                return None, total_attempts
+            raise MiningException("No valid nonce found")
+        # Several workers can find a nonce in the same batch, any of them is valid
+        return min(found_nonces), total_attempts
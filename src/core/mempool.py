@@ -0,0 +1,138 @@
+import threading
+from typing import Dict, List, Optional
+
+from src.core.transactions.transaction import Transaction, TransactionOutput
+from src.core.utxo_set import OutPoint, UTXOSet
+from src.utils.consts import MEMPOOL_SNAPSHOT_DELAY
+from src.utils.io_mem_pool import get_transactions_from_memory, save_transactions_in_memory
+
+
+class MempoolException(Exception):
+    pass
+
+
+class Mempool:
+    """
+        Transactions waiting to be mined, indexed by hash and by the outputs they spend.
+
+        Duplicates and transactions spending an output already spent by another pool transaction are rejected.
+        When a snapshot path is set, the pool is written there by a background timer a short while after it changes,
+        so a burst of submissions costs a single write.
+    """
+    def __init__(self, snapshot_path: str = None, snapshot_delay: float = MEMPOOL_SNAPSHOT_DELAY):
+        # Insertion ordered, so iterating gives the arrival order
+        self.transactions: Dict[str, Transaction] = {}
+        # Spent output -> hash of the pool transaction spending it
+        self.spent_outpoints: Dict[OutPoint, str] = {}
+        # Bumped by every change, so a block template can tell it is out of date
+        self.version = 0
+        self.lock = threading.RLock()
+        self.snapshot_path = snapshot_path
+        self.snapshot_delay = snapshot_delay
+        self.snapshot_timer: Optional[threading.Timer] = None
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def __contains__(self, tx_hash: str) -> bool:
+        return tx_hash in self.transactions
+
+    def get(self, tx_hash: str) -> Optional[Transaction]:
+        return self.transactions.get(tx_hash)
+
+    def get_transactions(self) -> List[Transaction]:
+        with self.lock:
+            return list(self.transactions.values())
+
+    def get_spending_transaction(self, outpoint: OutPoint) -> Optional[Transaction]:
+        tx_hash = self.spent_outpoints.get(outpoint)
+        return self.transactions.get(tx_hash) if tx_hash else None
+
+    def add(self, transaction: Transaction):
+        tx_hash = transaction.hash
+        with self.lock:
+            if tx_hash in self.transactions:
+                raise MempoolException("Transaction already in mempool")
+            for outpoint in transaction.outpoints:
+                conflicting_hash = self.spent_outpoints.get(outpoint)
+                if conflicting_hash:
+                    raise MempoolException(f"Transaction double spends an output of mempool transaction {conflicting_hash}")
+            self.transactions[tx_hash] = transaction
+            for outpoint in transaction.outpoints:
+                self.spent_outpoints[outpoint] = tx_hash
+            self.version += 1
+        self.schedule_snapshot()
+
+    def remove(self, tx_hash: str) -> Optional[Transaction]:
+        with self.lock:
+            transaction = self.transactions.pop(tx_hash, None)
+            if transaction:
+                for outpoint in transaction.outpoints:
+                    if self.spent_outpoints.get(outpoint) == tx_hash:
+                        del self.spent_outpoints[outpoint]
+                self.version += 1
+        if transaction:
+            self.schedule_snapshot()
+        return transaction
+
+    def remove_block_transactions(self, block):
+        """
+            Drops the transactions included in the block and the pool transactions that conflict with them.
+        """
+        with self.lock:
+            for transaction in block.transactions:
+                self.remove(transaction.hash)
+                for outpoint in transaction.outpoints:
+                    conflicting_hash = self.spent_outpoints.get(outpoint)
+                    if conflicting_hash:
+                        self.remove(conflicting_hash)
+
+    def clear(self):
+        with self.lock:
+            self.transactions.clear()
+            self.spent_outpoints.clear()
+            self.version += 1
+        self.schedule_snapshot()
+
+    def load_snapshot(self):
+        if not self.snapshot_path:
+            return
+        for transaction in get_transactions_from_memory(self.snapshot_path):
+            try:
+                self.add(Transaction.from_json(transaction))
+            except MempoolException as e:
+                print(f"Skipping transaction from mempool snapshot: {e}")
+
+    def schedule_snapshot(self):
+        if not self.snapshot_path:
+            return
+        with self.lock:
+            if self.snapshot_timer:
+                return
+            self.snapshot_timer = threading.Timer(self.snapshot_delay, self.write_snapshot)
+            self.snapshot_timer.daemon = True
+            self.snapshot_timer.start()
+
+    def write_snapshot(self):
+        with self.lock:
+            self.snapshot_timer = None
+            transactions = [transaction.to_dict for transaction in self.transactions.values()]
+        save_transactions_in_memory(transactions, self.snapshot_path)
+
+
+class MempoolUTXOView:
+    """
+        The chain UTXO set as it would be after mining the whole mempool, used to accept a transaction
+        that spends the output of another pool transaction.
+    """
+    def __init__(self, base: UTXOSet, mempool: Mempool):
+        self.base = base
+        self.mempool = mempool
+
+    def get(self, tx_hash: str, output_index: int) -> Optional[TransactionOutput]:
+        if (tx_hash, output_index) in self.mempool.spent_outpoints:
+            return None
+        parent = self.mempool.get(tx_hash)
+        if parent:
+            return parent.outputs[output_index] if 0 <= output_index < len(parent.outputs) else None
+        return self.base.get(tx_hash, output_index)
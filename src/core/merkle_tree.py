@@ -1,19 +1,30 @@
-import copy
+import binascii
+import hashlib
 import math
-from typing import List
+from typing import List, Optional
 
 from src.utils.crypto_utils import calculate_sha256
 
+# Nodes are hashed as the concatenation of their children's hex digests
+HEX_DIGEST_SIZE = 64
+
 
 class Node:
+    __slots__ = ("value", "left_child", "right_child")
+
     def __init__(self, value: str, left_child=None, right_child=None):
         self.value = value
         self.left_child = left_child
         self.right_child = right_child
 
 
+class MerkleTreeException(Exception):
+    pass
+
+
 class MerkleTree:
     def __init__(self, transactions_data: List[bytes]):
+        self.number_of_transactions = len(transactions_data)
         self.root = self.build_merkle_tree(transactions_data)
 
     @staticmethod
@@ -22,54 +33,105 @@ class MerkleTree:
 
     @staticmethod
     def is_power_of_2(number_of_leaves: int) -> bool:
-        return math.log2(number_of_leaves).is_integer()
+        return number_of_leaves > 0 and number_of_leaves & (number_of_leaves - 1) == 0
+
+    @staticmethod
+    def get_padded_size(number_of_leaves: int) -> int:
+        """
+            Number of leaves once the set is filled to a complete binary tree.
+
+            An odd last leaf is duplicated, then the last pair is repeated until the number of leaves is a power of 2.
+        """
+        padded_size = number_of_leaves + number_of_leaves % 2
+        return max(2, 2 ** math.ceil(math.log2(padded_size)))
 
     def fill_set(self, leaves: List[Node]) -> List[Node]:
         """
         Fills the given list of nodes to make it a complete binary tree.
 
         Args:
-            leaves (list[str]): The list of nodes to be filled.
+            leaves (list[Node]): The list of nodes to be filled.
 
         Returns:
-            list[str]: The filled list of nodes.
+            list[Node]: The filled list of nodes.
 
         """
-        num_of_leaves = len(leaves)
-        if num_of_leaves % 2 == 1:
-            leaves.append(copy.deepcopy(leaves[-1]))
-        if self.is_power_of_2(num_of_leaves):
-            return leaves
-        total_number_of_leaves = 2 ** self.compute_tree_depth(
-            num_of_leaves)
-        is_even_number_of_leaves = num_of_leaves % 2 == 0
-        if is_even_number_of_leaves:
-            for i in range(num_of_leaves, total_number_of_leaves, 2):
-                leaves = leaves + \
-                         [leaves[-2], leaves[-1]]
-        else:
-            for i in range(num_of_leaves, total_number_of_leaves):
-                leaves.append(leaves[-1])
+        total_number_of_leaves = self.get_padded_size(len(leaves))
+        if len(leaves) % 2 == 1:
+            leaves.append(leaves[-1])
+        last_pair = leaves[-2:]
+        while len(leaves) < total_number_of_leaves:
+            leaves.extend(last_pair)
         return leaves
 
     def build_merkle_tree(self, transactions_data: List[bytes]) -> Node:
         leaves = [Node(value=calculate_sha256(data))
-                            for data in transactions_data]
+                  for data in transactions_data]
         leaves = self.fill_set(leaves)
-        tree_depth = self.compute_tree_depth(len(leaves))
-
-        new_nodes = []
-        for i in range(0, tree_depth):
-            num_nodes = 2**(tree_depth - i)
-            new_nodes = []
-            for j in range(0, num_nodes, 2):
-                child_node_0 = leaves[j]
-                child_node_1 = leaves[j + 1]
-                new_node = Node(value=calculate_sha256(
-                    f'{child_node_0.value}{child_node_1.value}'),
-                    left_child=child_node_0,
-                    right_child=child_node_1)
-                new_nodes.append(new_node)
-            leaves = new_nodes
-        root = new_nodes[0]
-        return root
+        while len(leaves) > 1:
+            leaves = [Node(value=calculate_sha256(f'{leaves[j].value}{leaves[j + 1].value}'),
+                           left_child=leaves[j],
+                           right_child=leaves[j + 1])
+                      for j in range(0, len(leaves), 2)]
+        return leaves[0]
+
+    @staticmethod
+    def compute_root(transactions_data: List[bytes]) -> Optional[str]:
+        """
+            Root of the tree without building its nodes, same value as MerkleTree(transactions_data).root.value.
+
+            Each level is a single buffer of concatenated hex digests, so a node is hashed straight from a slice
+            of the level below. Runs in linear time, the root of no transactions is None.
+        """
+        if not transactions_data:
+            return None
+        level = bytearray()
+        for data in transactions_data:
+            level += binascii.hexlify(hashlib.sha256(data).digest())
+        last_leaf = level[-HEX_DIGEST_SIZE:]
+        if len(transactions_data) % 2 == 1:
+            level += last_leaf
+        last_pair = level[-2 * HEX_DIGEST_SIZE:]
+        padded_length = MerkleTree.get_padded_size(len(transactions_data)) * HEX_DIGEST_SIZE
+        level += last_pair * ((padded_length - len(level)) // len(last_pair))
+
+        while len(level) > HEX_DIGEST_SIZE:
+            level_view = memoryview(level)
+            next_level = bytearray()
+            for offset in range(0, len(level), 2 * HEX_DIGEST_SIZE):
+                next_level += binascii.hexlify(
+                    hashlib.sha256(level_view[offset:offset + 2 * HEX_DIGEST_SIZE]).digest())
+            level_view.release()
+            level = next_level
+        return level.decode()
+
+    def get_proof(self, index: int) -> List[dict]:
+        """
+            Authentication path of a leaf, from the leaf level up to the root.
+
+            Each step is the sibling hash and its side, "left" when it is hashed before the running value.
+        """
+        if not 0 <= index < self.number_of_transactions:
+            raise MerkleTreeException(f"No leaf at index {index}")
+        tree_depth = int(math.log2(self.get_padded_size(self.number_of_transactions)))
+        proof = []
+        node = self.root
+        for level in reversed(range(tree_depth)):
+            if (index >> level) & 1:
+                proof.append({"hash": node.left_child.value, "position": "left"})
+                node = node.right_child
+            else:
+                proof.append({"hash": node.right_child.value, "position": "right"})
+                node = node.left_child
+        proof.reverse()
+        return proof
+
+    @staticmethod
+    def verify_proof(leaf_hash: str, proof: List[dict], root: str) -> bool:
+        value = leaf_hash
+        for step in proof:
+            if step["position"] == "left":
+                value = calculate_sha256(f'{step["hash"]}{value}')
+            else:
+                value = calculate_sha256(f'{value}{step["hash"]}')
+        return value == root
@@ -0,0 +1,165 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from src.core.blockchain import Blockchain, BlockchainException
+from src.core.blocks.block import Block
+from src.core.blocks.mining import MiningException
+from src.utils.consts import MINER_POLL_INTERVAL, MINER_TEMPLATE_REFRESH
+
+
+class Miner:
+    """
+        Mines blocks on top of the chain on a background thread, until stopped or a number of blocks is mined.
+
+        While the nonce of a block candidate is searched, a watcher checks the chain tip and the mempool.
+        The search is cancelled as soon as another block becomes the last block, and when the mempool changed
+        once the candidate is template_refresh seconds old, then a new candidate is built.
+        A mined block is added to the chain and handed to on_block, to be broadcast.
+    """
+    def __init__(self, blockchain: Blockchain, on_block: Callable[[Block], None] = None,
+                 poll_interval: float = MINER_POLL_INTERVAL, template_refresh: float = MINER_TEMPLATE_REFRESH):
+        self.blockchain = blockchain
+        self.on_block = on_block
+        self.poll_interval = poll_interval
+        self.template_refresh = template_refresh
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        # Set to cancel the nonce search of the current candidate
+        self.cancel_event: Optional[threading.Event] = None
+        self.candidate: Optional[Block] = None
+        # Blocks to mine before stopping, None to mine until stopped
+        self.target: Optional[int] = None
+        self.blocks_mined = 0
+        self.templates_built = 0
+        self.searches_cancelled = 0
+        self.last_block_hash: Optional[str] = None
+        # Error that stopped the last run
+        self.error: Optional[str] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, blocks: int = None) -> bool:
+        """
+            Mines the given number of blocks more, or until stopped when blocks is None.
+            Returns False when the miner was already running, its target is extended instead.
+        """
+        with self.lock:
+            if self.extend_target(blocks):
+                return False
+            stopping_thread = self.thread
+        if stopping_thread:
+            # A stopping run may still be cancelling its search, wait for it so two runs never mine together
+            stopping_thread.join()
+        with self.lock:
+            if self.extend_target(blocks):
+                return False
+            self.stop_event.clear()
+            self.error = None
+            self.target = None if blocks is None else self.blocks_mined + blocks
+            self.thread = threading.Thread(target=self.run, name="miner", daemon=True)
+            self.thread.start()
+            return True
+
+    def extend_target(self, blocks: Optional[int]) -> bool:
+        if not self.is_running or self.stop_event.is_set():
+            return False
+        if self.target is not None:
+            self.target = None if blocks is None else self.target + blocks
+        return True
+
+    def stop(self, timeout: float = None):
+        with self.lock:
+            self.stop_event.set()
+            if self.cancel_event:
+                self.cancel_event.set()
+            thread = self.thread
+        if thread:
+            thread.join(timeout)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                if self.target is not None and self.blocks_mined >= self.target:
+                    self.stop_event.set()
+                    break
+            try:
+                self.mine_block()
+            except (BlockchainException, MiningException) as e:
+                print(f"Mining failed: {e}")
+                self.stop_event.wait(self.poll_interval)
+            except Exception as e:
+                # Not a rejected block, it would fail again on the next one
+                print(f"Miner stopped: {e!r}")
+                with self.lock:
+                    self.error = f"{e!r}"
+                    self.target = self.blocks_mined if self.target is not None else None
+                    self.stop_event.set()
+        self.candidate = None
+
+    def mine_block(self):
+        mempool = self.blockchain.mempool
+        mempool_version = mempool.version
+        candidate, validation = self.blockchain.create_block_candidate()
+        cancel_event = threading.Event()
+        with self.lock:
+            if self.stop_event.is_set():
+                return
+            self.candidate = candidate
+            self.cancel_event = cancel_event
+            self.templates_built += 1
+        watcher = threading.Thread(target=self.watch_template,
+                                   args=(cancel_event, candidate.header.previous_hash, mempool_version),
+                                   name="miner-watcher", daemon=True)
+        watcher.start()
+        try:
+            mining_result = self.blockchain.mining_engine.mine(candidate.header, cancel_event)
+        finally:
+            cancel_event.set()
+            watcher.join()
+        if mining_result.cancelled:
+            self.searches_cancelled += 1
+            return
+        candidate.header.nonce = mining_result.nonce
+        with self.blockchain.lock:
+            if self.blockchain.last_block.header.hash != candidate.header.previous_hash:
+                # Another block was added between the nonce being found and now
+                self.searches_cancelled += 1
+                return
+            self.blockchain.add_new_block(candidate, validation)
+        print(f"Mined block {candidate.header.index} after {mining_result.attempts} attempts - "
+              f"{mining_result.hashes_per_second:.0f} H/s on {mining_result.workers} workers")
+        with self.lock:
+            self.blocks_mined += 1
+            self.last_block_hash = candidate.header.hash
+        if self.on_block:
+            self.on_block(candidate)
+
+    def watch_template(self, cancel_event: threading.Event, previous_hash: str, mempool_version: int):
+        built_at = time.monotonic()
+        while not cancel_event.wait(self.poll_interval):
+            if self.stop_event.is_set() or self.blockchain.last_block.header.hash != previous_hash:
+                cancel_event.set()
+            elif self.blockchain.mempool.version != mempool_version \
+                    and time.monotonic() - built_at >= self.template_refresh:
+                cancel_event.set()
+
+    @property
+    def to_dict(self) -> dict:
+        with self.lock:
+            candidate = self.candidate
+            return {
+                "running": self.is_running and not self.stop_event.is_set(),
+                "blocks_mined": self.blocks_mined,
+                "blocks_to_mine": None if self.target is None else max(self.target - self.blocks_mined, 0),
+                "templates_built": self.templates_built,
+                "searches_cancelled": self.searches_cancelled,
+                "last_block_hash": self.last_block_hash,
+                "error": self.error,
+                "height": candidate.header.index if candidate else None,
+                "transactions": len(candidate.transactions) if candidate else None,
+                "progress": self.blockchain.mining_engine.progress,
+            }
@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from src.core.blocks.block import Block
+from src.utils.consts import ORPHAN_POOL_SIZE
+
+
+class OrphanPool:
+    """
+        Blocks received before their parent, indexed by hash and by the hash of the parent they wait for.
+
+        When a block is added to the chain, the orphans waiting on it are taken out and added after it.
+        Once max_size blocks are held, the oldest orphan is dropped for a new one.
+    """
+    def __init__(self, max_size: int = ORPHAN_POOL_SIZE):
+        self.max_size = max_size
+        # block hash -> block, oldest first
+        self.blocks: OrderedDict[str, Block] = OrderedDict()
+        # parent hash -> hashes of the orphans waiting on it
+        self.children: Dict[str, Set[str]] = {}
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self.blocks
+
+    def add(self, block: Block) -> bool:
+        block_hash = block.header.hash
+        with self.lock:
+            if block_hash in self.blocks:
+                return False
+            self.blocks[block_hash] = block
+            self.children.setdefault(block.header.previous_hash, set()).add(block_hash)
+            while len(self.blocks) > self.max_size:
+                self.remove(next(iter(self.blocks)))
+            return True
+
+    def remove(self, block_hash: str) -> Optional[Block]:
+        with self.lock:
+            block = self.blocks.pop(block_hash, None)
+            if block is None:
+                return None
+            siblings = self.children[block.header.previous_hash]
+            siblings.discard(block_hash)
+            if not siblings:
+                del self.children[block.header.previous_hash]
+            return block
+
+    def pop_children(self, parent_hash: str) -> List[Block]:
+        """
+            Takes out the orphans waiting on the block.
+        """
+        with self.lock:
+            return [self.remove(block_hash) for block_hash in list(self.children.get(parent_hash, ()))]
+
+    def get_missing_ancestor(self, block_hash: str) -> str:
+        """
+            Hash of the first ancestor of the block that isn't in the pool, the block to ask for.
+        """
+        with self.lock:
+            while block_hash in self.blocks:
+                block_hash = self.blocks[block_hash].header.previous_hash
+            return block_hash
@@ -0,0 +1,338 @@
+import struct
+from typing import List, Optional
+
+from src.core.blocks.block import Block, BlockHeader
+from src.core.transactions.transaction import Transaction, TransactionInput, TransactionOutput
+from src.utils.crypto_utils import hex_to_bytes
+
+# First byte of every encoded record, bumped when the layout changes
+FORMAT_VERSION = 1
+BINARY_CONTENT_TYPE = "application/vnd.blockchain+octet-stream"
+JSON_CONTENT_TYPE = "application/json"
+
+# Tags of string fields: hex strings travel as their raw bytes
+TEXT, HEX, NONE, OPCODE = 0, 1, 2, 3
+# Tags of numbers, ints and floats stay distinct since they serialize differently in the hashed JSON
+INT, FLOAT = 0, 1
+OPCODES = ("OP_DUP", "OP_HASH160", "OP_EQUALVERIFY", "OP_CHECKSIG")
+COIN_BASE_FLAG = 0x01
+
+FLOAT64 = struct.Struct(">d")
+
+
+class SerializationException(Exception):
+    pass
+
+
+class IncompleteDataException(SerializationException):
+    pass
+
+
+class BinaryWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write_byte(self, value: int):
+        self.buffer.append(value)
+
+    def write_varint(self, value: int):
+        if value < 0:
+            raise SerializationException(f"Can't encode negative length {value}")
+        while value > 0x7f:
+            self.buffer.append((value & 0x7f) | 0x80)
+            value >>= 7
+        self.buffer.append(value)
+
+    def write_int(self, value: int):
+        if type(value) is not int:
+            raise SerializationException(f"Expected an integer, got {value!r}")
+        # Zigzag, so small negative values stay short
+        self.write_varint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def write_number(self, value):
+        if type(value) is int:
+            self.write_byte(INT)
+            self.write_int(value)
+        elif type(value) is float:
+            self.write_byte(FLOAT)
+            self.buffer += FLOAT64.pack(value)
+        else:
+            raise SerializationException(f"Expected a number, got {value!r}")
+
+    def write_bytes(self, data: bytes):
+        self.write_varint(len(data))
+        self.buffer += data
+
+    def write_string(self, value: Optional[str]):
+        if value is None:
+            self.write_byte(NONE)
+        elif type(value) is not str:
+            raise SerializationException(f"Expected a string, got {value!r}")
+        elif value in OPCODES:
+            self.write_byte(OPCODE)
+            self.write_byte(OPCODES.index(value))
+        else:
+            raw = hex_to_bytes(value)
+            if raw is not None:
+                self.write_byte(HEX)
+            else:
+                self.write_byte(TEXT)
+                raw = value.encode("utf-8")
+            self.write_bytes(raw)
+
+    def write_script(self, script: str):
+        if type(script) is not str:
+            raise SerializationException(f"Expected a script, got {script!r}")
+        elements = script.split(" ")
+        self.write_varint(len(elements))
+        for element in elements:
+            self.write_string(element)
+
+
+class BinaryReader:
+    def __init__(self, data: bytes):
+        self.data = bytes(data)
+        self.offset = 0
+
+    @property
+    def at_end(self) -> bool:
+        return self.offset == len(self.data)
+
+    def read(self, length: int) -> bytes:
+        end = self.offset + length
+        if end > len(self.data):
+            raise IncompleteDataException("Unexpected end of data")
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def read_byte(self) -> int:
+        try:
+            value = self.data[self.offset]
+        except IndexError:
+            raise IncompleteDataException("Unexpected end of data")
+        self.offset += 1
+        return value
+
+    def read_varint(self) -> int:
+        value = self.read_byte()
+        if value < 0x80:
+            # Lengths, counts and indexes almost always fit in one byte
+            return value
+        value &= 0x7f
+        shift = 7
+        while True:
+            byte = self.read_byte()
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def read_int(self) -> int:
+        value = self.read_varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def read_number(self):
+        tag = self.read_byte()
+        if tag == INT:
+            return self.read_int()
+        if tag == FLOAT:
+            return FLOAT64.unpack(self.read(FLOAT64.size))[0]
+        raise SerializationException(f"Unknown number tag {tag}")
+
+    def read_bytes(self) -> bytes:
+        return self.read(self.read_varint())
+
+    def read_string(self) -> Optional[str]:
+        tag = self.read_byte()
+        if tag == HEX:
+            return self.read(self.read_varint()).hex()
+        if tag == TEXT:
+            try:
+                return self.read(self.read_varint()).decode("utf-8")
+            except UnicodeDecodeError as e:
+                raise SerializationException(f"Invalid text field - {e}")
+        if tag == NONE:
+            return None
+        if tag == OPCODE:
+            opcode = self.read_byte()
+            if opcode >= len(OPCODES):
+                raise SerializationException(f"Unknown opcode {opcode}")
+            return OPCODES[opcode]
+        raise SerializationException(f"Unknown string tag {tag}")
+
+    def read_script(self) -> str:
+        return " ".join(self.read_string() for _ in range(self.read_varint()))
+
+
+def write_transaction(writer: BinaryWriter, transaction: Transaction):
+    writer.write_byte(COIN_BASE_FLAG if transaction.is_coin_base else 0)
+    writer.write_varint(len(transaction.inputs))
+    for tx_input in transaction.inputs:
+        writer.write_string(tx_input.transaction_hash)
+        writer.write_int(tx_input.output_index)
+        writer.write_script(tx_input.unlocking_script)
+    writer.write_varint(len(transaction.outputs))
+    for tx_output in transaction.outputs:
+        # The locking script is always built from the public key hash
+        writer.write_number(tx_output.amount)
+        writer.write_string(tx_output.public_key_hash)
+
+
+def read_transaction(reader: BinaryReader) -> Transaction:
+    flags = reader.read_byte()
+    inputs = [TransactionInput(reader.read_string(), reader.read_int(), reader.read_script())
+              for _ in range(reader.read_varint())]
+    outputs = []
+    for _ in range(reader.read_varint()):
+        amount = reader.read_number()
+        outputs.append(TransactionOutput(reader.read_string(), amount))
+    return Transaction(inputs, outputs, is_coin_base=bool(flags & COIN_BASE_FLAG))
+
+
+def write_header(writer: BinaryWriter, header: BlockHeader):
+    writer.write_int(header.index)
+    writer.write_string(header.previous_hash)
+    writer.write_string(header.merkle_root)
+    writer.write_int(header.nonce)
+    writer.write_number(header.timestamp)
+
+
+def read_header(reader: BinaryReader) -> BlockHeader:
+    index = reader.read_int()
+    previous_hash = reader.read_string()
+    merkle_root = reader.read_string()
+    nonce = reader.read_int()
+    return BlockHeader(index, previous_hash, merkle_root, nonce, reader.read_number())
+
+
+def write_block(writer: BinaryWriter, block: Block):
+    write_header(writer, block.header)
+    writer.write_varint(len(block.transactions))
+    for transaction in block.transactions:
+        transaction_writer = BinaryWriter()
+        write_transaction(transaction_writer, transaction)
+        writer.write_bytes(transaction_writer.buffer)
+
+
+def read_block(reader: BinaryReader) -> Block:
+    header = read_header(reader)
+    transactions = [decode_record(reader.read_bytes(), read_transaction, with_version=False)
+                    for _ in range(reader.read_varint())]
+    return Block(header, transactions)
+
+
+def encode_record(value, write) -> bytes:
+    writer = BinaryWriter()
+    writer.write_byte(FORMAT_VERSION)
+    write(writer, value)
+    return bytes(writer.buffer)
+
+
+def decode_record(data: bytes, read, with_version: bool = True):
+    reader = BinaryReader(data)
+    if with_version:
+        version = reader.read_byte()
+        if version != FORMAT_VERSION:
+            raise SerializationException(f"Unsupported format version {version}")
+    value = read(reader)
+    if not reader.at_end:
+        raise SerializationException("Unexpected data after the end of the record")
+    return value
+
+
+def encode_transaction(transaction: Transaction) -> bytes:
+    """
+        version byte, flags byte, input count, then per input its transaction hash, output index and unlocking script
+        elements, output count, then per output its amount and public key hash.
+
+        Counts and lengths are unsigned LEB128 varints, integers are zigzag varints, floats are big endian float64,
+        strings are a tag byte followed by their hex-decoded bytes, utf-8 text or opcode number.
+    """
+    return encode_record(transaction, write_transaction)
+
+
+def decode_transaction(data: bytes) -> Transaction:
+    return decode_record(data, read_transaction)
+
+
+def encode_header(header: BlockHeader) -> bytes:
+    return encode_record(header, write_header)
+
+
+def decode_header(data: bytes) -> BlockHeader:
+    return decode_record(data, read_header)
+
+
+def encode_block(block: Block) -> bytes:
+    """
+        version byte, header (index, previous hash, merkle root, nonce, timestamp), transaction count,
+        then each transaction without its version byte, prefixed by its length.
+    """
+    return encode_record(block, write_block)
+
+
+def decode_block(data: bytes) -> Block:
+    return decode_record(data, read_block)
+
+
+def encode_chain_start(count: int) -> bytes:
+    """
+        Start of an encoded chain of count blocks, as streamed by /chain: version byte and block count,
+        then the entries follow.
+    """
+    writer = BinaryWriter()
+    writer.write_byte(FORMAT_VERSION)
+    writer.write_varint(count)
+    return bytes(writer.buffer)
+
+
+def encode_chain_entry(encoded_block: bytes) -> bytes:
+    """
+        An encoded block as an entry of an encoded chain, its version byte is replaced by its length.
+    """
+    if encoded_block[:1] != bytes([FORMAT_VERSION]):
+        raise SerializationException("Not an encoded block")
+    writer = BinaryWriter()
+    writer.write_bytes(memoryview(encoded_block)[1:])
+    return bytes(writer.buffer)
+
+
+class ChainDecoder:
+    """
+        Decodes an encoded chain received in pieces, each piece gives back the blocks it completes.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        # Blocks still expected, None until the start of the chain is received
+        self.remaining = None
+
+    def feed(self, data: bytes) -> List[Block]:
+        self.buffer += data
+        reader = BinaryReader(self.buffer)
+        blocks = []
+        if self.remaining is None:
+            try:
+                version = reader.read_byte()
+                count = reader.read_varint()
+            except IncompleteDataException:
+                return blocks
+            if version != FORMAT_VERSION:
+                raise SerializationException(f"Unsupported format version {version}")
+            self.remaining = count
+        consumed = reader.offset
+        while self.remaining:
+            try:
+                record = reader.read_bytes()
+            except IncompleteDataException:
+                break
+            consumed = reader.offset
+            # A complete record that fails to decode is an error, not a piece still to come
+            blocks.append(decode_record(record, read_block, with_version=False))
+            self.remaining -= 1
+        del self.buffer[:consumed]
+        return blocks
+
+    def finish(self):
+        if self.remaining is None or self.remaining or self.buffer:
+            raise SerializationException("Incomplete chain")
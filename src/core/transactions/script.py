@@ -1,7 +1,9 @@
+from src.utils.consts import SCRIPT_CACHE_SIZE
 from src.utils.crypto_utils import calculate_sha256, calculate_ripemd160
 from src.wallet.wallet import Wallet
 
 import binascii
+from functools import lru_cache
 
 class StackScriptException(Exception):
     pass
@@ -18,9 +20,11 @@ class Stack:
 
 
 class StackScript(Stack):
-    def __init__(self, transaction_bytes: bytes):
+    def __init__(self, transaction_bytes: bytes, signature_jobs: list = None):
         super().__init__()
         self.transaction_bytes = transaction_bytes
+        # When a list is given, OP_CHECKSIG adds a SignatureJob to it instead of verifying right away
+        self.signature_jobs = signature_jobs
 
     def op_dup(self):
         """
@@ -41,7 +45,7 @@ class StackScript(Stack):
             computes its SHA-256 hash, then its RIPEMD-160 hash, and pushes the result back onto the stack.
         """
         public_key = self.pop()
-        self.push(calculate_ripemd160(calculate_sha256(public_key)))
+        self.push(StackScript.hash160(public_key))
 
     def op_equalverify(self):
         """
@@ -66,22 +70,87 @@ class StackScript(Stack):
 
         public_key = self.pop()
         signature = self.pop()
+        self.check_signature(signature, public_key)
+
+    def check_signature(self, signature: str, public_key: str):
+        if self.signature_jobs is not None:
+            from src.core.transactions.signature_verification import SignatureJob
+            self.signature_jobs.append(SignatureJob(signature, public_key, self.transaction_bytes))
+            return
         public_key_bytes = public_key.encode("utf-8")
         if not Wallet.valid_signature(binascii.unhexlify(signature), public_key_bytes, self.transaction_bytes):
             raise StackScriptException("Invalid signature")
 
+    @staticmethod
+    @lru_cache(maxsize=SCRIPT_CACHE_SIZE)
+    def hash160(public_key: str) -> str:
+        return calculate_ripemd160(calculate_sha256(public_key))
+
+    @staticmethod
+    @lru_cache(maxsize=SCRIPT_CACHE_SIZE)
+    def compile(script: str) -> tuple:
+        """
+            Parses a script once into (operation, operand) pairs, cached per script text.
+
+            Operations are the StackScript methods to call with no operand, other elements are pushed as operands.
+        """
+        compiled = []
+        for element in script.split(" "):
+            if element.startswith("OP"):
+                operation = getattr(StackScript, element.lower(), None)
+                if operation is None:
+                    raise StackScriptException(f"Unknown operation {element}")
+                compiled.append((operation, None))
+            else:
+                compiled.append((None, element))
+        return tuple(compiled)
+
+    @staticmethod
+    def get_p2pkh_public_key_hash(script: str):
+        """
+            Public key hash of an "OP_DUP OP_HASH160 <pkh> OP_EQUALVERIFY OP_CHECKSIG" script, None for any other script.
+        """
+        compiled = StackScript.compile(script)
+        if tuple(operation for operation, _ in compiled) == P2PKH_OPERATIONS:
+            return compiled[2][1]
+        return None
 
     def execute(self, script: str):
         """
             Executes a given script by interpreting each element.
 
-            Iterates over each element in the script string. If the element is an operation (starting with 'OP'),
-            it dynamically calls the corresponding method in the StackScript class. Otherwise, it pushes the element onto the stack.
+            Runs the compiled form of the script: operations (elements starting with 'OP') call the corresponding
+            method in the StackScript class, other elements are pushed onto the stack.
         """
-        script = script.split(" ")
-        for element in script:
-            if element.startswith("OP"):
-                class_method = getattr(StackScript, element.lower())
-                class_method(self)
+        for operation, operand in StackScript.compile(script):
+            if operation is None:
+                self.push(operand)
             else:
-                self.push(element)
+                operation(self)
+
+    def run(self, unlocking_script: str, locking_script: str):
+        """
+            Executes the unlocking script and then the locking script.
+
+            A standard pay to public key hash spend, "<signature> <public key>" against
+            "OP_DUP OP_HASH160 <pkh> OP_EQUALVERIFY OP_CHECKSIG", is checked directly without the stack machine,
+            with the same results and errors as the interpreter.
+        """
+        public_key_hash = StackScript.get_p2pkh_public_key_hash(locking_script)
+        unlocking_elements = unlocking_script.split(" ")
+        is_standard_spend = (
+            public_key_hash is not None and not self.elements and len(unlocking_elements) == 2 and
+            not any(element.startswith("OP") for element in unlocking_elements)
+        )
+        if not is_standard_spend:
+            self.execute(unlocking_script)
+            self.execute(locking_script)
+            return
+        signature, public_key = unlocking_elements
+        if not StackScript.hash160(public_key) == public_key_hash:
+            raise StackScriptException("Invalid hash")
+        self.check_signature(signature, public_key)
+
+
+# Compiled shape of a pay to public key hash locking script, None marks the pushed public key hash
+P2PKH_OPERATIONS = (StackScript.op_dup, StackScript.op_hash160, None, StackScript.op_equalverify, StackScript.op_checksig)
@@ -0,0 +1,54 @@
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+from src.utils.consts import SIGNATURE_VERIFICATION_WORKERS, SIGNATURE_VERIFICATION_BATCH_SIZE
+from src.wallet.wallet import Wallet
+
+
+@dataclass(frozen=True)
+class SignatureJob:
+    """
+        One OP_CHECKSIG to run: hex signature and hex public key as they appear in the script,
+        and the signed transaction bytes.
+    """
+    signature: str
+    public_key: str
+    message: bytes
+
+    def verify(self) -> bool:
+        try:
+            signature = binascii.unhexlify(self.signature)
+        except (ValueError, TypeError):
+            return False
+        return Wallet.valid_signature(signature, self.public_key.encode("utf-8"), self.message)
+
+
+class SignatureVerifier:
+    """
+        Runs signature jobs on a pool of threads.
+
+        Identical jobs are verified once, every input of a transaction signed by sign_inputs carries the same signature.
+        The RSA arithmetic runs in native code that releases the GIL, so the threads verify in parallel.
+    """
+    def __init__(self, workers: int = SIGNATURE_VERIFICATION_WORKERS,
+                 batch_size: int = SIGNATURE_VERIFICATION_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="signature-verifier") \
+            if workers > 1 else None
+
+    @staticmethod
+    def verify_batch(jobs: List[SignatureJob]) -> List[bool]:
+        return [job.verify() for job in jobs]
+
+    def verify(self, jobs: Iterable[SignatureJob]) -> Dict[SignatureJob, bool]:
+        unique_jobs = list(dict.fromkeys(jobs))
+        if self.executor is None or len(unique_jobs) <= self.batch_size:
+            return dict(zip(unique_jobs, self.verify_batch(unique_jobs)))
+        batches = [unique_jobs[i:i + self.batch_size] for i in range(0, len(unique_jobs), self.batch_size)]
+        results = {}
+        for batch, batch_results in zip(batches, self.executor.map(self.verify_batch, batches)):
+            results.update(zip(batch, batch_results))
+        return results
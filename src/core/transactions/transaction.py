@@ -1,16 +1,57 @@
+import hashlib
 import json
 from typing import List
 
-from src.utils.crypto_utils import calculate_sha256
+from src.utils.crypto_utils import compact_hex, expand_hex
 from src.wallet.wallet import Wallet
 
 
+def compact_script(script: str):
+    """
+        Script elements as a tuple, with hex elements (signatures and public keys) kept as raw bytes.
+    """
+    if type(script) is not str:
+        return script
+    return tuple(compact_hex(element) for element in script.split(" "))
+
+
+def expand_script(compact) -> str:
+    if type(compact) is not tuple:
+        return compact
+    return " ".join(expand_hex(element) for element in compact)
+
+
 class TransactionInput:
+    # Fields that feed the transaction hash can't change once set, so the hash can be cached
+    HASHED_FIELDS = ("transaction_hash", "output_index")
+    __slots__ = ("_transaction_hash", "output_index", "_unlocking_script")
+
     def __init__(self, transaction_hash: str, output_index: int, unlocking_script: str = ""):
         self.transaction_hash = transaction_hash
         self.output_index = output_index
         self.unlocking_script = unlocking_script
 
+    def __setattr__(self, name, value):
+        if name in TransactionInput.HASHED_FIELDS and hasattr(self, name):
+            raise AttributeError(f"{name} is part of the transaction hash and can't be changed")
+        super().__setattr__(name, value)
+
+    @property
+    def transaction_hash(self) -> str:
+        return expand_hex(self._transaction_hash)
+
+    @transaction_hash.setter
+    def transaction_hash(self, transaction_hash: str):
+        self._transaction_hash = compact_hex(transaction_hash)
+
+    @property
+    def unlocking_script(self) -> str:
+        return expand_script(self._unlocking_script)
+
+    @unlocking_script.setter
+    def unlocking_script(self, unlocking_script: str):
+        self._unlocking_script = compact_script(unlocking_script)
+
     def __eq__(self, other: 'TransactionInput'):
         return (
             self.transaction_hash == other.transaction_hash
@@ -48,12 +89,30 @@ class TransactionInput:
 
 
 class TransactionOutput:
-    def __init__(self, public_key_hash: bytes, amount: float):
+    # Every field of an output is part of the transaction hash, the locking script is derived from the public key hash
+    HASHED_FIELDS = ("amount", "public_key_hash")
+    __slots__ = ("amount", "_public_key_hash")
+
+    def __init__(self, public_key_hash: str, amount: float):
         self.amount = amount
         self.public_key_hash = public_key_hash
-        self.locking_script = (
-            f"OP_DUP OP_HASH160 {public_key_hash} OP_EQUALVERIFY OP_CHECKSIG"
-        )
+
+    def __setattr__(self, name, value):
+        if name in TransactionOutput.HASHED_FIELDS and hasattr(self, name):
+            raise AttributeError(f"{name} is part of the transaction hash and can't be changed")
+        super().__setattr__(name, value)
+
+    @property
+    def public_key_hash(self) -> str:
+        return expand_hex(self._public_key_hash)
+
+    @public_key_hash.setter
+    def public_key_hash(self, public_key_hash: str):
+        self._public_key_hash = compact_hex(public_key_hash)
+
+    @property
+    def locking_script(self) -> str:
+        return f"OP_DUP OP_HASH160 {self.public_key_hash} OP_EQUALVERIFY OP_CHECKSIG"
 
     def __eq__(self, other: 'TransactionOutput'):
         return (
@@ -85,11 +144,29 @@ class TransactionOutput:
 
 
 class Transaction:
+    HASHED_FIELDS = ("inputs", "outputs")
+    __slots__ = ("inputs", "outputs", "is_coin_base", "_signing_bytes", "_merkle_leaf_bytes", "_hash")
+
     def __init__(self, inputs: List[TransactionInput], outputs: List[TransactionOutput], is_coin_base=False):
         self.inputs = inputs
         self.outputs = outputs
         self.is_coin_base = is_coin_base
 
+    def __setattr__(self, name, value):
+        if name in Transaction.HASHED_FIELDS:
+            # Stored as tuples so they can't be changed in place behind the cached hash
+            value = tuple(value)
+            self.release_serialized_data()
+            super().__setattr__("_hash", None)
+        super().__setattr__(name, value)
+
+    def release_serialized_data(self):
+        """
+            Drops the cached serializations, they are rebuilt when needed. The hash stays cached.
+        """
+        super().__setattr__("_signing_bytes", None)
+        super().__setattr__("_merkle_leaf_bytes", None)
+
     def __eq__(self, other: 'Transaction'):
         return (
             self.inputs == other.inputs
@@ -112,23 +189,62 @@ class Transaction:
         }
 
     @property
-    def hash(self):
-        transaction_bytes = json.dumps(
-            self.to_dict_no_script, indent=2).encode('utf-8')
-        return calculate_sha256(transaction_bytes)
+    def to_bytes(self) -> bytes:
+        from src.core.serialization import encode_transaction
+        return encode_transaction(self)
+
+    @property
+    def size(self) -> int:
+        """
+            Size in bytes of the serialized transaction as it is sent to other nodes.
+        """
+        return len(self.to_bytes)
+
+    @property
+    def outpoints(self) -> List[tuple]:
+        return [(tx_input.transaction_hash, tx_input.output_index) for tx_input in self.inputs]
+
+    @property
+    def signing_bytes(self) -> bytes:
+        """
+            Serialized transaction without unlocking scripts, this is what gets hashed, signed and verified.
+        """
+        signing_bytes = self._signing_bytes
+        if signing_bytes is None:
+            signing_bytes = json.dumps(self.to_dict_no_script, indent=2).encode('utf-8')
+            self._signing_bytes = signing_bytes
+        return signing_bytes
+
+    @property
+    def merkle_leaf_bytes(self) -> bytes:
+        """
+            Data hashed into the leaf of the transaction in the block merkle tree.
+        """
+        merkle_leaf_bytes = self._merkle_leaf_bytes
+        if merkle_leaf_bytes is None:
+            merkle_leaf_bytes = json.dumps(self.to_dict_no_script).encode('utf-8')
+            self._merkle_leaf_bytes = merkle_leaf_bytes
+        return merkle_leaf_bytes
+
+    @property
+    def hash(self) -> str:
+        # Cached as hex, the same string is shared by the UTXO set and the chain indexes
+        transaction_hash = self._hash
+        if transaction_hash is None:
+            transaction_hash = hashlib.sha256(self.signing_bytes).hexdigest()
+            self._hash = transaction_hash
+        return transaction_hash
 
     def sign_transaction_data(self, owner: Wallet):
-        transaction_bytes = json.dumps(
-            self.to_dict_no_script, indent=2).encode('utf-8')
         signature = Wallet.convert_signature_to_str(
-            owner.sign(transaction_bytes))
+            owner.sign(self.signing_bytes))
         return signature
 
     def sign_inputs(self, owner: Wallet):
         signature = self.sign_transaction_data(owner)
+        unlocking_script = f"{signature} {owner.public_key_hex}"
         for transaction_input in self.inputs:
-            transaction_input.unlocking_script = f"{
-                signature} {owner.public_key_hex}"
+            transaction_input.unlocking_script = unlocking_script
 
     @staticmethod
     def from_json(data: dict) -> 'Transaction':
@@ -136,10 +252,12 @@ class Transaction:
             input_data) for input_data in data['inputs']]
         outputs = [TransactionOutput.from_json(
             output_data) for output_data in data['outputs']]
-        return Transaction(inputs, outputs, is_coin_base=False)
+        return Transaction(inputs, outputs, is_coin_base=data.get('is_coin_base', False))
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'Transaction':
+        from src.core.serialization import decode_transaction
+        return decode_transaction(data)
 
     def send_to_nodes(self) -> dict:
-        return {
-            "inputs": [i.to_json() for i in self.inputs],
-            "outputs": [i.to_json() for i in self.outputs],
-        }
+        return self.to_dict
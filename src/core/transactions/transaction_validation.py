@@ -1,9 +1,10 @@
-from core.transactions.script import StackScriptException
-from src.core.blockchain import Blockchain
-from src.core.transactions.script import StackScript
-from src.core.transactions.transaction import Transaction
+from typing import Dict, List, Tuple
 
-import json
+from src.core.blockchain import Blockchain
+from src.core.transactions.script import StackScript, StackScriptException
+from src.core.transactions.signature_verification import SignatureJob
+from src.core.transactions.transaction import Transaction, TransactionOutput
+from src.core.utxo_set import UTXOSet, UTXOView
 
 from src.utils.consts import MINER_REWARD
 
@@ -12,22 +13,35 @@ class TransactionValidationException(Exception):
     pass
 
 class TransactionValidation:
-    def __init__(self, blockchain: Blockchain, transaction: Transaction):
+    def __init__(self, blockchain: Blockchain, transaction: Transaction, allow_coin_base: bool = False,
+                 utxo_set: UTXOSet | UTXOView = None, defer_signatures: bool = False):
         self.blockchain = blockchain
         self.transaction = transaction
+        # Coinbase transactions are only valid as the reward of a block
+        self.allow_coin_base = allow_coin_base
+        # Inputs are resolved against the chain unless a view with pending block transactions is given
+        self.utxo_set = utxo_set if utxo_set is not None else blockchain.utxo_set
+        # Inputs minus outputs, set by validate_funds
+        self.fee = 0
+        # With deferred signatures the (input index, signature job) pairs are left for the caller to verify in a batch
+        self.defer_signatures = defer_signatures
+        self.signature_jobs: List[Tuple[int, SignatureJob]] = []
+
+    def get_utxo(self, utxo_hash: str, utxo_index: int) -> TransactionOutput:
+        utxo = self.utxo_set.get(utxo_hash, utxo_index)
+        if utxo is None:
+            raise TransactionValidationException("UTXO not found or already spent")
+        return utxo
 
     def get_locking_script_from_utxo(self, utxo_hash: str, utxo_index: int):
-        transaction = self.blockchain.get_transaction_from_utxo(utxo_hash)
-        if not (transaction is None):
-            return transaction.outputs[utxo_index].locking_script
+        return self.get_utxo(utxo_hash, utxo_index).locking_script
 
     def get_total_amount_in_inputs(self) -> int:
         total_in = 0
         for tx_input in self.transaction.inputs:
-            transaction = self.blockchain.get_transaction_from_utxo(
-                tx_input.transaction_hash)
-            utxo_amount = transaction.outputs[tx_input.output_index].amount
-            total_in = total_in + utxo_amount
+            utxo = self.get_utxo(
+                tx_input.transaction_hash, tx_input.output_index)
+            total_in = total_in + utxo.amount
         return total_in
 
     def get_total_amount_in_outputs(self) -> int:
@@ -48,21 +62,65 @@ class TransactionValidation:
         else:
             if not total_inputs >= total_outputs:
                 raise TransactionValidationException("Invalid transaction funds")
+            self.fee = total_inputs - total_outputs
 
     def validate_scripts(self):
+        validation_cache = self.blockchain.validation_cache
+        if validation_cache.has_valid_scripts(self.transaction):
+            return
+        self.signature_jobs = []
         try:
-            for tx_input in self.transaction.inputs:
+            for input_index, tx_input in enumerate(self.transaction.inputs):
                 locking_script = self.get_locking_script_from_utxo(
                     tx_input.transaction_hash, tx_input.output_index)
                 unlocking_script = tx_input.unlocking_script
-                transaction_bytes = json.dumps(
-                self.transaction.to_dict_no_script, indent=2).encode('utf-8')
-                stack_script = StackScript(transaction_bytes)
-                stack_script.execute(unlocking_script)
-                stack_script.execute(locking_script)
+                input_signature_jobs = []
+                stack_script = StackScript(self.transaction.signing_bytes, signature_jobs=input_signature_jobs)
+                stack_script.run(unlocking_script, locking_script)
+                self.signature_jobs.extend((input_index, job) for job in input_signature_jobs)
         except (StackScriptException, TransactionValidationException) as e:
             raise TransactionValidationException(f'Invalid transaction inputs - {e}')
+        if self.defer_signatures:
+            return
+        signature_results = self.blockchain.signature_verifier.verify(job for _, job in self.signature_jobs)
+        self.check_signature_results(signature_results)
+
+    def check_signature_results(self, signature_results: Dict[SignatureJob, bool]):
+        """
+            Fails with the inputs whose signature didn't verify, and caches the scripts as valid otherwise.
+        """
+        invalid_inputs = sorted({input_index for input_index, job in self.signature_jobs
+                                 if not signature_results[job]})
+        if invalid_inputs:
+            raise TransactionValidationException(
+                f'Invalid transaction inputs - Invalid signature for inputs {invalid_inputs}')
+        self.blockchain.validation_cache.add_valid_scripts(self.transaction)
+
+    def validate_double_spend(self):
+        outpoints = self.transaction.outpoints
+        if len(set(outpoints)) != len(outpoints):
+            raise TransactionValidationException("Transaction spends the same UTXO twice")
+
+    def validate_coin_base(self):
+        if self.transaction.is_coin_base and not self.allow_coin_base:
+            raise TransactionValidationException("Coinbase transaction outside of a block reward")
+
+    @staticmethod
+    def validate_field_types(transaction: Transaction):
+        """
+            Fields decoded from JSON can hold any type, they must have the types the binary encoding expects.
+        """
+        for tx_input in transaction.inputs:
+            if type(tx_input.transaction_hash) is not str or type(tx_input.output_index) is not int \
+                    or type(tx_input.unlocking_script) is not str:
+                raise TransactionValidationException("Invalid transaction input fields")
+        for tx_output in transaction.outputs:
+            if type(tx_output.amount) not in (int, float) or type(tx_output.public_key_hash) is not str:
+                raise TransactionValidationException("Invalid transaction output fields")
 
     def validate(self):
+        self.validate_field_types(self.transaction)
+        self.validate_coin_base()
+        self.validate_double_spend()
         self.validate_scripts()
         self.validate_funds()
@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Tuple
+
+from src.core.transactions.transaction import Transaction, TransactionOutput
+
+# An output is identified by the hash of the transaction that created it and its position in that transaction
+OutPoint = Tuple[str, int]
+# Outputs spent by each transaction of a connected block, in block order, enough to disconnect the block again
+BlockUndo = List[List[Tuple[OutPoint, TransactionOutput]]]
+
+
+class UTXOSet:
+    """
+        Index of every unspent transaction output of the chain, keyed by (transaction_hash, output_index).
+
+        The set is updated incrementally when a block is connected, so looking up an input
+        does not need to walk the chain.
+    """
+    def __init__(self):
+        self.outputs: Dict[OutPoint, TransactionOutput] = {}
+
+    def __contains__(self, outpoint: OutPoint) -> bool:
+        return outpoint in self.outputs
+
+    def __len__(self) -> int:
+        return len(self.outputs)
+
+    def get(self, tx_hash: str, output_index: int) -> Optional[TransactionOutput]:
+        return self.outputs.get((tx_hash, output_index))
+
+    def add_transaction(self, transaction: Transaction):
+        tx_hash = transaction.hash
+        for output_index, transaction_output in enumerate(transaction.outputs):
+            self.outputs[(tx_hash, output_index)] = transaction_output
+
+    def spend_transaction(self, transaction: Transaction,
+                          spent_outputs: List[Tuple[OutPoint, TransactionOutput]] = None) \
+            -> List[Tuple[OutPoint, TransactionOutput]]:
+        spent_outputs = [] if spent_outputs is None else spent_outputs
+        for transaction_input in transaction.inputs:
+            outpoint = (transaction_input.transaction_hash, transaction_input.output_index)
+            transaction_output = self.outputs.pop(outpoint, None)
+            if transaction_output is not None:
+                spent_outputs.append((outpoint, transaction_output))
+        return spent_outputs
+
+    def apply_block(self, block) -> BlockUndo:
+        """
+            Applies every transaction of the block or, when one of them fails, none.
+        """
+        block_undo = []
+        try:
+            for transaction in block.transactions:
+                # Identical coinbase transactions share a hash, the output replaced by a later one is restored with it
+                tx_hash = transaction.hash
+                spent_outputs = [((tx_hash, output_index), self.outputs[(tx_hash, output_index)])
+                                 for output_index in range(len(transaction.outputs))
+                                 if (tx_hash, output_index) in self.outputs]
+                block_undo.append(spent_outputs)
+                self.spend_transaction(transaction, spent_outputs)
+                self.add_transaction(transaction)
+        except Exception:
+            self.undo_block(block, block_undo)
+            raise
+        return block_undo
+
+    def undo_block(self, block, block_undo: BlockUndo):
+        """
+            Reverts apply_block: transactions are undone last first, so an output spent inside the block
+            is restored before the transaction that created it removes it again.
+            A partial undo, as left by a failed apply_block, reverts the first transactions only.
+        """
+        transactions = block.transactions[:len(block_undo)]
+        for transaction, spent_outputs in zip(reversed(transactions), reversed(block_undo)):
+            tx_hash = transaction.hash
+            for output_index in range(len(transaction.outputs)):
+                self.outputs.pop((tx_hash, output_index), None)
+            for outpoint, transaction_output in spent_outputs:
+                self.outputs[outpoint] = transaction_output
+
+
+class UTXOView:
+    """
+        Pending changes on top of a UTXO set, used to validate transactions that spend outputs created earlier
+        in the same block without touching the chain state.
+    """
+    def __init__(self, base: UTXOSet):
+        self.base = base
+        self.added: Dict[OutPoint, TransactionOutput] = {}
+        self.spent = set()
+
+    def __contains__(self, outpoint: OutPoint) -> bool:
+        return self.get(*outpoint) is not None
+
+    def get(self, tx_hash: str, output_index: int) -> Optional[TransactionOutput]:
+        outpoint = (tx_hash, output_index)
+        if outpoint in self.spent:
+            return None
+        if outpoint in self.added:
+            return self.added[outpoint]
+        return self.base.get(tx_hash, output_index)
+
+    def add_transaction(self, transaction: Transaction):
+        tx_hash = transaction.hash
+        for output_index, transaction_output in enumerate(transaction.outputs):
+            outpoint = (tx_hash, output_index)
+            self.added[outpoint] = transaction_output
+            self.spent.discard(outpoint)
+
+    def spend_transaction(self, transaction: Transaction):
+        for transaction_input in transaction.inputs:
+            self.spent.add((transaction_input.transaction_hash, transaction_input.output_index))
+
+    def apply_transaction(self, transaction: Transaction):
+        self.spend_transaction(transaction)
+        self.add_transaction(transaction)
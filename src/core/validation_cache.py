@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict
+
+from src.core.transactions.transaction import Transaction
+from src.utils.consts import VALIDATION_CACHE_SIZE
+
+
+class ValidationCache:
+    """
+        Bounded record of validation work that doesn't depend on the chain tip.
+
+        A transaction hash commits to the outputs it spends, so its scripts stay valid for the same unlocking scripts.
+        A block hash commits to its proof of work and transactions.
+        The least recently used entries are dropped once max_size is reached.
+    """
+    def __init__(self, max_size: int = VALIDATION_CACHE_SIZE):
+        self.max_size = max_size
+        self.valid_scripts = OrderedDict()
+        self.valid_blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_scripts_key(transaction: Transaction) -> tuple:
+        # Unlocking scripts aren't part of the transaction hash
+        return transaction.hash, tuple(tx_input.unlocking_script for tx_input in transaction.inputs)
+
+    def lookup(self, entries: OrderedDict, key) -> bool:
+        with self.lock:
+            if key in entries:
+                entries.move_to_end(key)
+                return True
+            return False
+
+    def store(self, entries: OrderedDict, key):
+        with self.lock:
+            entries[key] = None
+            entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def has_valid_scripts(self, transaction: Transaction) -> bool:
+        return self.lookup(self.valid_scripts, self.get_scripts_key(transaction))
+
+    def add_valid_scripts(self, transaction: Transaction):
+        self.store(self.valid_scripts, self.get_scripts_key(transaction))
+
+    def has_valid_block(self, block_hash: str) -> bool:
+        return self.lookup(self.valid_blocks, block_hash)
+
+    def add_valid_block(self, block_hash: str):
+        self.store(self.valid_blocks, block_hash)
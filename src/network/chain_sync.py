@@ -0,0 +1,183 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+import requests
+
+from src.core.blockchain import Blockchain, BlockchainException, OrphanBlockException
+from src.core.blocks.block import BlockHeader
+from src.core.serialization import SerializationException
+from src.network.network import Network
+from src.network.node import Node, NodeException
+from src.utils.consts import SYNC_HEADERS_BATCH_SIZE, SYNC_BLOCKS_BATCH_SIZE, ORPHAN_PARENT_REQUESTS
+
+
+class ChainSyncException(Exception):
+    pass
+
+
+class ChainSync:
+    """
+        Header-first catch up with the peers.
+
+        The tips of the peers are asked for in parallel and the highest peer ahead of the local chain is picked.
+        A locator of the local chain tells it the last block both chains share. Its headers after that block must
+        link to each other and carry a valid proof of work before any block is downloaded,
+        then the missing blocks are fetched and validated in batches. When the peer is on another branch,
+        its blocks are added as a side branch that replaces the end of the local chain once it has more work.
+    """
+    def __init__(self, blockchain: Blockchain, network: Network, headers_batch_size: int = SYNC_HEADERS_BATCH_SIZE,
+                 blocks_batch_size: int = SYNC_BLOCKS_BATCH_SIZE):
+        self.blockchain = blockchain
+        self.network = network
+        self.headers_batch_size = headers_batch_size
+        self.blocks_batch_size = blocks_batch_size
+        self.lock = threading.Lock()
+        # Missing parents of orphan blocks being asked for
+        self.requested_parents: Set[str] = set()
+        self.requested_parents_lock = threading.Lock()
+
+    @staticmethod
+    def get_tip(node: Node) -> Optional[dict]:
+        try:
+            return node.get_tip()
+        except (requests.RequestException, NodeException, ValueError) as e:
+            print(f'Unable to get the chain tip of node - {node.hostname} - {e}')
+            return None
+
+    def get_peer_tips(self) -> List[Tuple[Node, int]]:
+        """
+            Known nodes and their chain heights, highest first.
+        """
+        nodes = self.network.known_nodes
+        if not nodes:
+            return []
+        with ThreadPoolExecutor(max_workers=len(nodes), thread_name_prefix="chain-sync") as executor:
+            tips = list(executor.map(self.get_tip, nodes))
+        peer_tips = [(node, tip.get("height", 0)) for node, tip in zip(nodes, tips) if tip]
+        return sorted(peer_tips, key=lambda peer_tip: peer_tip[1], reverse=True)
+
+    def get_headers(self, node: Node, **params) -> List[BlockHeader]:
+        headers = node.get_headers(**params)
+        if not headers:
+            raise ChainSyncException(f"No headers for {params}")
+        return headers
+
+    def get_new_headers(self, node: Node, peer_height: int) -> Tuple[int, List[BlockHeader]]:
+        """
+            Height of the last block shared with the node, and the headers of the node after it checked to form
+            a chain with a valid proof of work.
+
+            The first batch is asked for with the locator of the local chain, so it starts right after that block.
+        """
+        from src.core.blocks.block_validation import ProofOfWork
+        headers = self.get_headers(node, locator=self.blockchain.get_locator(), count=self.headers_batch_size)
+        ancestor_height = headers[0].index - 1
+        ancestor = self.blockchain.get_block_by_height(ancestor_height)
+        previous_hash = ancestor.header.hash if ancestor else None
+        new_headers = []
+        while True:
+            for header in headers:
+                if header.index != len(new_headers) + ancestor_height + 1 or header.previous_hash != previous_hash:
+                    raise ChainSyncException(f"Header at height {header.index} doesn't follow the previous one")
+                if not ProofOfWork.is_valid_nonce(header):
+                    raise ChainSyncException(f"Header at height {header.index} has an invalid proof of work")
+                new_headers.append(header)
+                previous_hash = header.hash
+            next_height = ancestor_height + len(new_headers) + 1
+            if next_height > peer_height:
+                return ancestor_height, new_headers
+            headers = self.get_headers(node, from_height=next_height,
+                                       count=min(self.headers_batch_size, peer_height - next_height + 1))
+
+    def download_blocks(self, node: Node, headers: List[BlockHeader]) -> int:
+        """
+            Validates and adds each block as it arrives, while the rest of the batch is still downloading.
+        """
+        added = 0
+        for start in range(0, len(headers), self.blocks_batch_size):
+            batch_headers = headers[start:start + self.blocks_batch_size]
+            received = 0
+            for header, block in zip(batch_headers, node.iter_blockchain(from_height=batch_headers[0].index,
+                                                                         count=len(batch_headers))):
+                if block.header.hash != header.hash:
+                    raise ChainSyncException(f"Block at height {header.index} doesn't match its header")
+                received += 1
+                if header.hash in self.blockchain.block_index:
+                    # Added meanwhile, as an orphan waiting on an earlier block of the batch
+                    continue
+                self.blockchain.add_new_block(block)
+                added += 1
+            if received != len(batch_headers):
+                raise ChainSyncException(f"Missing blocks from height {batch_headers[received].index}")
+        return added
+
+    def sync_with(self, node: Node, peer_height: int) -> int:
+        ancestor_height, headers = self.get_new_headers(node, peer_height)
+        if ancestor_height < self.blockchain.length:
+            # The blocks go to a side branch, and the chain switches to it once the branch has more work
+            print(f'Node - {node.hostname} - is on another branch from height {ancestor_height + 1}')
+        return self.download_blocks(node, headers)
+
+    def sync(self) -> int:
+        """
+            Brings the local chain up to the highest peer ahead of it, returns the number of blocks added.
+            Peers are tried from the highest down until one of them can be synced with.
+        """
+        with self.lock:
+            for node, peer_height in self.get_peer_tips():
+                if peer_height <= self.blockchain.length:
+                    break
+                try:
+                    added = self.sync_with(node, peer_height)
+                except (ChainSyncException, BlockchainException, SerializationException,
+                        requests.RequestException, NodeException, ValueError) as e:
+                    print(f'Chain sync with node - {node.hostname} - failed: {e}')
+                    continue
+                if added:
+                    print(f'Synced {added} blocks from node - {node.hostname} - up to height {self.blockchain.length}')
+                    return added
+            return 0
+
+    def start_background_sync(self):
+        """
+            Runs a sync on its own thread unless one is already running.
+        """
+        if self.lock.locked():
+            return
+        threading.Thread(target=self.sync, name="chain-sync", daemon=True).start()
+
+    def fetch_missing_parents(self, node: Node, orphan_hash: str, max_requests: int = ORPHAN_PARENT_REQUESTS):
+        """
+            Asks the node that sent an orphan block for its missing ancestors one by one, the orphans are added
+            once the chain reaches them. A gap of more than max_requests blocks is left to a chain sync.
+        """
+        requested_hash = missing_hash = self.blockchain.orphans.get_missing_ancestor(orphan_hash)
+        with self.requested_parents_lock:
+            if requested_hash in self.requested_parents:
+                return
+            self.requested_parents.add(requested_hash)
+        try:
+            for _ in range(max_requests):
+                if missing_hash in self.blockchain.block_index:
+                    return
+                block = node.get_block(missing_hash)
+                if block is None or block.header.hash != missing_hash:
+                    raise ChainSyncException(f"Node didn't send block {missing_hash}")
+                try:
+                    self.blockchain.add_new_block(block)
+                    return
+                except OrphanBlockException:
+                    missing_hash = block.header.previous_hash
+            print(f'Orphan block {orphan_hash} is more than {max_requests} blocks ahead, syncing the chain')
+        except (ChainSyncException, BlockchainException, SerializationException,
+                requests.RequestException, NodeException, ValueError) as e:
+            print(f'Unable to get the parents of orphan block {orphan_hash} from node - {node.hostname} - {e}')
+        finally:
+            with self.requested_parents_lock:
+                self.requested_parents.discard(requested_hash)
+        self.start_background_sync()
+
+    def start_fetch_missing_parents(self, node: Node, orphan_hash: str):
+        threading.Thread(target=self.fetch_missing_parents, args=(node, orphan_hash),
+                         name="orphan-parents", daemon=True).start()
@@ -0,0 +1,79 @@
+import threading
+from typing import Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.consts import PEER_POOL_SIZE, PEER_CONNECT_TIMEOUT, PEER_READ_TIMEOUT
+
+
+class PeerConnections:
+    """
+        One requests.Session per peer, so messages to a peer reuse its keep-alive connections
+        instead of opening a TCP connection each time.
+
+        Up to pool_size connections per peer stay open, enough for the gossip threads sending to it concurrently.
+    """
+    def __init__(self, pool_size: int = PEER_POOL_SIZE, connect_timeout: float = PEER_CONNECT_TIMEOUT,
+                 read_timeout: float = PEER_READ_TIMEOUT):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # peer base url -> session
+        self.sessions: Dict[str, requests.Session] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+    def get_session(self, hostname: str) -> requests.Session:
+        with self.lock:
+            session = self.sessions.get(hostname)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[hostname] = session
+            return session
+
+    def close(self, hostname: str = None):
+        with self.lock:
+            hostnames = [hostname] if hostname else list(self.sessions)
+            sessions = [self.sessions.pop(name) for name in hostnames if name in self.sessions]
+        for session in sessions:
+            session.close()
+
+    @staticmethod
+    def get_session_stats(session: requests.Session) -> dict:
+        requests_sent = 0
+        connections_opened = 0
+        pools = session.get_adapter("http://").poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "connections_reused": requests_sent - connections_opened,
+        }
+
+    @property
+    def to_dict(self) -> dict:
+        with self.lock:
+            sessions = dict(self.sessions)
+        peers = {hostname: self.get_session_stats(session) for hostname, session in sessions.items()}
+        requests_sent = sum(stats["requests"] for stats in peers.values())
+        connections_reused = sum(stats["connections_reused"] for stats in peers.values())
+        return {
+            "pool_size": self.pool_size,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "requests": requests_sent,
+            "connections_reused": connections_reused,
+            "reuse_ratio": connections_reused / requests_sent if requests_sent else 0,
+            "peers": peers,
+        }
@@ -0,0 +1,94 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import requests
+
+from src.network.node import Node, NodeException
+from src.utils.consts import GOSSIP_WORKERS, GOSSIP_TIMEOUT, GOSSIP_MAX_ATTEMPTS, GOSSIP_RETRY_DELAY
+
+
+@dataclass
+class GossipDelivery:
+    node: Node
+    path: str
+    data: bytes
+    headers: Optional[dict] = None
+    attempt: int = 1
+
+
+class Gossip:
+    """
+        Sends messages to peers in the background.
+
+        publish only queues one delivery per peer and returns. A scheduler thread hands due deliveries to a pool
+        of threads, so peers are contacted concurrently and a slow peer only holds its own thread.
+        A failed delivery is scheduled again after a delay that doubles with each attempt. A delivery that couldn't
+        reach the peer in any attempt counts once against it in the peer table, which drops peers that can't be
+        reached. A peer that rejects the message isn't retried.
+    """
+    def __init__(self, workers: int = GOSSIP_WORKERS, timeout: float = GOSSIP_TIMEOUT,
+                 max_attempts: int = GOSSIP_MAX_ATTEMPTS, retry_delay: float = GOSSIP_RETRY_DELAY):
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gossip")
+        # (due time, sequence number, delivery), the sequence number keeps deliveries due at the same time in order
+        self.scheduled: List[tuple] = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.scheduler = threading.Thread(target=self.run_scheduler, name="gossip-scheduler", daemon=True)
+        self.scheduler.start()
+
+    def publish(self, nodes: List[Node], path: str, data: bytes, headers: dict = None):
+        for node in nodes:
+            self.schedule(GossipDelivery(node, path, data, headers))
+
+    def schedule(self, delivery: GossipDelivery, delay: float = 0):
+        with self.condition:
+            heapq.heappush(self.scheduled, (time.monotonic() + delay, next(self.sequence), delivery))
+            self.condition.notify()
+
+    def run_scheduler(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.scheduled or self.scheduled[0][0] > time.monotonic()):
+                    timeout = self.scheduled[0][0] - time.monotonic() if self.scheduled else None
+                    self.condition.wait(timeout)
+                if self.stopped:
+                    return
+                _, _, delivery = heapq.heappop(self.scheduled)
+            self.executor.submit(self.deliver, delivery)
+
+    def deliver(self, delivery: GossipDelivery):
+        node = delivery.node
+        try:
+            node.post_bytes(delivery.path, delivery.data, timeout=self.timeout, headers=delivery.headers,
+                            record_failure=False)
+            return
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code < 500:
+                print(f'{node.hostname} rejected {delivery.path} - {e.response.text}')
+                return
+            error = e
+        except (requests.RequestException, NodeException) as e:
+            error = e
+        if delivery.attempt < self.max_attempts:
+            delay = self.retry_delay * 2 ** (delivery.attempt - 1)
+            self.schedule(GossipDelivery(node, delivery.path, delivery.data, delivery.headers, delivery.attempt + 1), delay)
+            return
+        print(f'Unable to send {delivery.path} to node - {node.hostname} - after {delivery.attempt} attempts: {error}')
+        if isinstance(error, requests.ConnectionError):
+            node.record_unreachable()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.scheduled.clear()
+            self.condition.notify()
+        self.executor.shutdown(wait=False, cancel_futures=True)
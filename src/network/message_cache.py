@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.utils.consts import MESSAGE_CACHE_SIZE, MESSAGE_CACHE_TTL
+
+
+class MessageCache:
+    """
+        Hashes of the gossip messages already processed, so a block or transaction relayed by several peers
+        is handled once.
+
+        An entry expires ttl seconds after it was last seen, and the least recently seen entries are dropped once
+        max_size is reached. Every entry lives for the same ttl, so the recency order is also the expiry order.
+    """
+    def __init__(self, max_size: int = MESSAGE_CACHE_SIZE, ttl: float = MESSAGE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # message hash -> expiry time
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def evict(self, now: float):
+        while self.entries and (len(self.entries) > self.max_size or next(iter(self.entries.values())) <= now):
+            self.entries.popitem(last=False)
+
+    def seen(self, message_hash: str) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            self.evict(now)
+            if message_hash not in self.entries:
+                return False
+            self.entries[message_hash] = now + self.ttl
+            self.entries.move_to_end(message_hash)
+            return True
+
+    def add(self, message_hash: str) -> bool:
+        """
+            Records the message, returns False when it was already there.
+        """
+        if self.seen(message_hash):
+            return False
+        with self.lock:
+            if message_hash in self.entries:
+                return False
+            self.entries[message_hash] = time.monotonic() + self.ttl
+            self.evict(time.monotonic())
+            return True
+
+    def discard(self, message_hash: str):
+        with self.lock:
+            self.entries.pop(message_hash, None)
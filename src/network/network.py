@@ -1,7 +1,10 @@
 from core.blocks.block import Block
 from core.transactions.transaction import Transaction
+from src.network.connections import PeerConnections
+from src.network.gossip import Gossip
 from src.network.node import Node
-from src.utils.io_known_nodes import add_known_nodes, get_known_nodes
+from src.network.peer_table import PeerTable
+from src.utils.consts import BLOCK_HASH_HEADER, TRANSACTION_HASH_HEADER, NODE_HEADER
 from typing import List
 
 from wallet.wallet import Wallet
@@ -11,42 +14,31 @@ class Network:
     def __init__(self, node: Node, wallet: Wallet):
         self.node = node
         self.wallet = wallet
+        self.connections = PeerConnections()
+        self.gossip = Gossip()
+        self.peers = PeerTable(node, self.connections)
+        self.peers.load()
 
     @property
     def known_nodes(self) -> List[Node]:
-        known_nodes = []
-        for node in get_known_nodes():
-            node = Node.from_json(node)
-            if not (node == self.node):
-                known_nodes.append(node)
-        return known_nodes
+        return self.peers.nodes
 
     @property
     def other_nodes_exist(self) -> bool:
-        if len(self.known_nodes) == 0:
-            return False
-        elif len(self.known_nodes) == 1 and self.known_nodes[0].hostname == self.node.hostname:
-            return False
-        else:
-            return True
+        return len(self.peers) > 0
 
     def add_known_nodes(self, nodes: List[Node]):
-        for node in nodes:
-            if node not in self.known_nodes:
-                self.known_nodes.append(node)
-                add_known_nodes([node.to_dict for node in nodes])
+        self.peers.add(nodes)
 
     def advertise_to_all_known_nodes(self):
         for node in self.known_nodes:
-            if node.hostname != self.node.hostname:
-                node.advertise(self.node.to_dict)
+            node.advertise(self.node.to_dict)
 
     def set_known_nodes_from_known_nodes(self):
         for known_node in self.known_nodes:
-            if known_node != self.node:
-                known_nodes_of_known_node = known_node.get_known_nodes()
-                if known_nodes_of_known_node:
-                    self.add_known_nodes([Node.from_json(node) for node in known_nodes_of_known_node])
+            known_nodes_of_known_node = known_node.get_known_nodes()
+            if known_nodes_of_known_node:
+                self.add_known_nodes([Node.from_json(node) for node in known_nodes_of_known_node])
 
     def join_network(self):
         if self.other_nodes_exist:
@@ -54,29 +46,16 @@ class Network:
             self.set_known_nodes_from_known_nodes()
             self.advertise_to_all_known_nodes()
 
-    def get_longest_blockchain(self):
-        longest_blockchain_size = 0
-        longest_blockchain = None
-        for node in self.known_nodes:
-            if node.hostname != self.node.hostname:
-                blockchain = node.get_blockchain()
-                blockchain_length = len(blockchain)
-                if blockchain_length > longest_blockchain_size:
-                    longest_blockchain_size = blockchain_length
-                    longest_blockchain = blockchain
-        return longest_blockchain
-
-    def broadcast_post(self, path: str, data: dict):
-        for node in self.known_nodes:
-            node.post(path, data)
-
-    def broadcast_get(self, path: str):
-        for node in self.known_nodes:
-            node.get(path)
+    def broadcast_post_bytes(self, path: str, data: bytes, headers: dict = None):
+        """
+            Queued on the gossip threads, returns before the peers are contacted.
+            The peers are told which node sent the message, so they can ask it for what they are missing.
+        """
+        self.gossip.publish(self.known_nodes, path, data, {NODE_HEADER: self.node.hostname, **(headers or {})})
 
     def broadcast_transaction(self, transaction: Transaction, path: str="/transaction"):
         transaction.sign_inputs(owner=self.wallet)
-        self.broadcast_post(path, {"transaction": transaction.send_to_nodes()})
+        self.broadcast_post_bytes(path, transaction.to_bytes, {TRANSACTION_HASH_HEADER: transaction.hash})
 
     def broadcast_block(self, block: Block, path: str="/block"):
-        self.broadcast_post(path, {"block": block.to_dict})
\ No newline at end of file
+        self.broadcast_post_bytes(path, block.to_bytes, {BLOCK_HASH_HEADER: block.header.hash})
\ No newline at end of file
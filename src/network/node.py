@@ -1,6 +1,12 @@
+import codecs
+import json
+import time
 import requests
-from typing import List
+from typing import Iterator, List, Optional
 
+from src.core.blocks.block import Block, BlockHeader
+from src.core.serialization import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE, ChainDecoder
+from src.network.connections import PeerConnections
 from src.utils.io_known_nodes import remove_known_node
 
 class NodeException(Exception):
@@ -11,16 +17,91 @@ class NodeException(Exception):
     def __str__(self):
         return self.message
 
+# Bytes read from a streamed response at once
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_list(response: requests.Response) -> Iterator:
+    """
+        Items of a JSON list response, decoded as the chunks arrive instead of once the whole body is read.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON list")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The item continues in the next chunk
+                break
+            yield item
+        buffer = buffer[position:]
+    raise ValueError("Incomplete JSON list")
+
+
 class Node:
-    def __init__(self, ip= "127.0.0.1", port = 5000):
+    def __init__(self, ip= "127.0.0.1", port = 5000, connections: PeerConnections = None, peers=None):
         self.ip = ip
         self.port = port
         self.hostname = f'http://{ip}:{port}'
+        # Pooled keep-alive connections shared with the network, a new connection per request without it
+        self.connections = connections
+        # PeerTable the node belongs to, told how each request to the node went
+        self.peers = peers
+
+    @property
+    def session(self):
+        return self.connections.get_session(self.hostname) if self.connections else requests
+
+    @property
+    def timeout(self):
+        return self.connections.timeout if self.connections else 5
+
+    def request(self, method: str, path: str, timeout: float = None, record_failure: bool = True,
+                **kwargs) -> requests.Response:
+        """
+            Sends a request to the node, its answer time or the failure to reach it goes to the peer table.
+            A caller that retries records the failure itself, once all its attempts failed.
+        """
+        started = time.monotonic()
+        try:
+            req_return = self.session.request(method, f"{self.hostname}{path}", timeout=timeout or self.timeout,
+                                              **kwargs)
+        except requests.ConnectionError:
+            if record_failure:
+                self.record_unreachable()
+            raise
+        if self.peers is not None:
+            self.peers.record_answer(self, time.monotonic() - started)
+        return req_return
+
+    def record_unreachable(self):
+        if self.peers is not None:
+            self.peers.record_failure(self)
+            return
+        print(f'Removing node - {self.hostname} - from network_nodes.js')
+        remove_known_node(self.to_dict)
 
     def post(self, path: str, data: dict) -> requests.Response:
         try:
             url = f"{self.hostname}{path}"
-            req_return = requests.post(url, json=data, timeout=5)
+            req_return = self.request("POST", path, json=data)
             req_return.raise_for_status()
             if req_return.status_code == 200:
                 return req_return.json()
@@ -28,22 +109,36 @@ class Node:
                 raise NodeException(f"Unexpected status code {req_return.status_code} from {url}")
         except requests.ConnectionError:
             print(f'Unable to connect to node - {self.hostname}')
-            print(f'Removing node - {self.hostname} - from network_nodes.js')
-            remove_known_node(self.to_dict)
 
-    def get(self, path: str):
+    def post_bytes(self, path: str, data: bytes, timeout: float = None, headers: dict = None,
+                   record_failure: bool = True) -> str:
+        """
+            Posts a binary record. Failures are raised so the caller decides whether to retry or drop the node.
+        """
+        url = f"{self.hostname}{path}"
+        req_return = self.request("POST", path, timeout=timeout, record_failure=record_failure, data=data,
+                                  headers={"Content-Type": BINARY_CONTENT_TYPE, **(headers or {})})
+        req_return.raise_for_status()
+        if req_return.status_code != 200:
+            raise NodeException(f"Unexpected status code {req_return.status_code} from {url}")
+        return req_return.text
+
+    def get_response(self, path: str, params: dict = None, headers: dict = None,
+                     stream: bool = False) -> Optional[requests.Response]:
         try:
             url = f"{self.hostname}{path}"
-            req_return = requests.get(url, timeout=5)
+            req_return = self.request("GET", path, params=params, headers=headers, stream=stream)
             req_return.raise_for_status()
             if req_return.status_code == 200:
-                return req_return.json()
+                return req_return
             else:
                 raise NodeException(f"Unexpected status code {req_return.status_code} from {url}")
         except requests.ConnectionError:
             print(f'Unable to connect to node - {self.hostname}')
-            print(f'Removing node - {self.hostname} - from network_nodes.js')
-            remove_known_node(self.to_dict)
+
+    def get(self, path: str):
+        req_return = self.get_response(path)
+        return req_return.json() if req_return is not None else None
 
     @property
     def to_dict(self):
@@ -63,8 +158,53 @@ class Node:
     def advertise(self, node: dict) -> requests.Response:
         return self.post("/advertise", {"node": node})
 
-    def get_blockchain(self):
-        return self.get("/chain")
+    def get_block(self, block_hash: str) -> Optional[Block]:
+        req_return = self.get_response(f"/block/{block_hash}",
+                                       headers={"Accept": f"{BINARY_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.5"})
+        if req_return is None:
+            return None
+        if req_return.headers.get("Content-Type", "").startswith(BINARY_CONTENT_TYPE):
+            return Block.from_bytes(req_return.content)
+        return Block.from_json(req_return.json())
+
+    def get_tip(self) -> Optional[dict]:
+        return self.get("/chain/tip")
+
+    def get_headers(self, from_height: int = None, count: int = None,
+                    locator: List[str] = None) -> List[BlockHeader]:
+        """
+            Headers from from_height, or after the first hash of the locator the node knows, in height order.
+        """
+        params = {"from_height": from_height, "count": count,
+                  "locator": ",".join(locator) if locator is not None else None}
+        req_return = self.get_response("/chain/headers", params=params, stream=True)
+        if req_return is None:
+            return []
+        with req_return:
+            return [BlockHeader.from_json(header) for header in iter_json_list(req_return)]
+
+    def iter_blockchain(self, from_height: int = None, count: int = None) -> Iterator[Block]:
+        """
+            Blocks of the node from the last one to the genesis block, or count blocks from from_height in height
+            order. Blocks are decoded as they arrive, in the binary format unless the node only answers JSON.
+        """
+        params = {"from_height": from_height, "count": count}
+        req_return = self.get_response("/chain", params=params, stream=True,
+                                       headers={"Accept": f"{BINARY_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.5"})
+        if req_return is None:
+            return
+        with req_return:
+            if req_return.headers.get("Content-Type", "").startswith(BINARY_CONTENT_TYPE):
+                chain_decoder = ChainDecoder()
+                for chunk in req_return.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    yield from chain_decoder.feed(chunk)
+                chain_decoder.finish()
+            else:
+                for block in iter_json_list(req_return):
+                    yield Block.from_json(block)
+
+    def get_blockchain(self, from_height: int = None, count: int = None) -> List[Block]:
+        return list(self.iter_blockchain(from_height, count))
 
     def ping(self):
         return self.get("/")
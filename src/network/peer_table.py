@@ -0,0 +1,158 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from src.network.connections import PeerConnections
+from src.network.node import Node
+from src.utils.consts import PEER_TABLE_SAVE_DELAY, PEER_MAX_FAILURES, PEER_LATENCY_SMOOTHING
+from src.utils.io_known_nodes import known_nodes, get_known_nodes, save_known_nodes
+
+
+@dataclass(slots=True)
+class PeerStats:
+    # Consecutive failures to reach the peer, reset by any answer
+    failures: int = 0
+    answers: int = 0
+    last_seen: Optional[float] = None
+    # Exponential moving average of the seconds the peer takes to answer
+    latency: Optional[float] = None
+
+    @property
+    def to_dict(self) -> dict:
+        return {
+            "failures": self.failures,
+            "answers": self.answers,
+            "last_seen": self.last_seen,
+            "latency": self.latency,
+        }
+
+
+class PeerTable:
+    """
+        The known nodes, kept in memory and indexed by hostname.
+
+        Each peer has liveness and latency stats, updated by the nodes after every request. A peer that can't
+        be reached max_failures times in a row is dropped.
+        Changes are written to the known nodes file by a background timer a short while after they happen,
+        so a burst of advertisements costs a single write. The file is shared with the other nodes running on
+        the same machine, so a write merges with it instead of overwriting it.
+    """
+    def __init__(self, local_node: Node, connections: PeerConnections = None, path: str = known_nodes,
+                 save_delay: float = PEER_TABLE_SAVE_DELAY, max_failures: int = PEER_MAX_FAILURES):
+        self.local_node = local_node
+        self.connections = connections
+        self.path = path
+        self.save_delay = save_delay
+        self.max_failures = max_failures
+        # hostname -> node, insertion ordered
+        self.peers: Dict[str, Node] = {}
+        self.stats: Dict[str, PeerStats] = {}
+        # Hostnames dropped since the last write, so the write removes them from the file too
+        self.removed: Set[str] = set()
+        self.lock = threading.RLock()
+        self.save_timer: Optional[threading.Timer] = None
+
+    def __len__(self) -> int:
+        return len(self.peers)
+
+    def __contains__(self, node: Node) -> bool:
+        return node.hostname in self.peers
+
+    def get(self, hostname: str) -> Optional[Node]:
+        return self.peers.get(hostname)
+
+    @property
+    def nodes(self) -> List[Node]:
+        with self.lock:
+            return list(self.peers.values())
+
+    def load(self):
+        with self.lock:
+            for node in get_known_nodes(self.path):
+                self.insert(Node.from_json(node))
+
+    def insert(self, node: Node) -> bool:
+        if node.hostname == self.local_node.hostname or node.hostname in self.peers:
+            return False
+        self.peers[node.hostname] = Node(node.ip, node.port, connections=self.connections, peers=self)
+        self.stats[node.hostname] = PeerStats()
+        self.removed.discard(node.hostname)
+        return True
+
+    def add(self, nodes: Iterable[Node]) -> bool:
+        with self.lock:
+            added = [node for node in nodes if self.insert(node)]
+        if added:
+            self.schedule_save()
+        return bool(added)
+
+    def remove(self, node: Node):
+        with self.lock:
+            if self.peers.pop(node.hostname, None) is None:
+                return
+            del self.stats[node.hostname]
+            self.removed.add(node.hostname)
+        if self.connections:
+            self.connections.close(node.hostname)
+        self.schedule_save()
+
+    def record_answer(self, node: Node, latency: float):
+        with self.lock:
+            stats = self.stats.get(node.hostname)
+            if stats is None:
+                return
+            stats.failures = 0
+            stats.answers += 1
+            stats.last_seen = time.time()
+            stats.latency = latency if stats.latency is None else \
+                stats.latency + PEER_LATENCY_SMOOTHING * (latency - stats.latency)
+
+    def record_failure(self, node: Node):
+        with self.lock:
+            stats = self.stats.get(node.hostname)
+            if stats is None:
+                return
+            stats.failures += 1
+            if stats.failures < self.max_failures:
+                return
+        print(f'Removing node - {node.hostname} - after {self.max_failures} failed attempts to reach it')
+        self.remove(node)
+
+    def schedule_save(self):
+        with self.lock:
+            if self.save_timer:
+                return
+            self.save_timer = threading.Timer(self.save_delay, self.write)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def write(self):
+        file_nodes = get_known_nodes(self.path)
+        with self.lock:
+            self.save_timer = None
+            # Nodes another local node wrote since the last write join the table
+            for node in file_nodes:
+                node = Node.from_json(node)
+                if node.hostname not in self.removed:
+                    self.insert(node)
+            self.removed.clear()
+            nodes = [node for node in file_nodes if Node.from_json(node).hostname == self.local_node.hostname]
+            nodes += [node.to_dict for node in self.peers.values()]
+        save_known_nodes(nodes, self.path)
+
+    def close(self):
+        """
+            Writes pending changes right away.
+        """
+        with self.lock:
+            pending = self.save_timer is not None
+            if pending:
+                self.save_timer.cancel()
+        if pending:
+            self.write()
+
+    @property
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {hostname: self.stats[hostname].to_dict for hostname in self.peers}
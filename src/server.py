@@ -1,18 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from typing import Iterator, List
 from flask_cors import CORS
+import json
 import signal
 import sys
 
 from src.core.blocks.block import Block
-from src.core.blocks.block_validation import BlockValidation, BlockException
+from src.core.blockchain import BlockchainException, OrphanBlockException
+from src.core.mempool import MempoolException, MempoolUTXOView
+from src.core.miner import Miner
+from src.core.merkle_tree import MerkleTree
+from src.core.serialization import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE, SerializationException, \
+    encode_chain_entry, encode_chain_start
 from src.core.transactions.transaction import Transaction
 from src.core.transactions.transaction_validation import TransactionValidationException, TransactionValidation
+from src.network.chain_sync import ChainSync
+from src.network.message_cache import MessageCache
 from src.network.node import Node
+from src.utils.consts import SYNC_BLOCKS_BATCH_SIZE, SYNC_HEADERS_BATCH_SIZE, BLOCK_HASH_HEADER, \
+    TRANSACTION_HASH_HEADER, NODE_HEADER
 from src.utils.io_known_nodes import add_known_nodes
-from src.utils.io_mem_pool import store_transactions_in_memory
-from src.utils.server_utils import get_host_port, cleanup, generate_message_id
+from src.utils.crypto_utils import calculate_sha256
+from src.utils.server_utils import get_host_port, cleanup
 from src.wallet.initialize_blockchain import initialize_blockchain
-from src.wallet.wallet import Wallet
+from src.wallet.wallet import Wallet, public_key_cache
 from src.network.network import Network
 
 app = Flask(__name__)
@@ -26,12 +37,27 @@ my_wallet = Wallet()
 add_known_nodes([my_node.to_dict])
 network = Network(my_node, my_wallet)
 blockchain = initialize_blockchain(my_wallet=my_wallet, network=network)
+chain_sync = ChainSync(blockchain, network)
 
-processed_messages = set()
+seen_blocks = MessageCache()
+seen_transactions = MessageCache()
+
+
+def broadcast_mined_block(block: Block):
+    seen_blocks.add(block.header.hash)
+    network.broadcast_block(block)
+
+
+miner = Miner(blockchain, on_block=broadcast_mined_block)
 
 
 def handle_close(*args):
+    miner.stop()
+    network.peers.close()
     cleanup(my_node)
+    network.gossip.stop()
+    network.connections.close()
+    blockchain.mempool.write_snapshot()
     sys.exit(0)
 
 
@@ -39,6 +65,59 @@ signal.signal(signal.SIGINT, handle_close)
 signal.signal(signal.SIGTERM, handle_close)
 
 
+def read_request_object(key: str, from_json, from_bytes):
+    """
+        Object posted either as a binary record or as {key: <json>}, None when the request doesn't carry one.
+    """
+    if request.mimetype == BINARY_CONTENT_TYPE:
+        return from_bytes(request.get_data())
+    content = request.json
+    return from_json(content.get(key)) if content.get(key) else None
+
+
+def get_requested_block_hashes(max_count: int) -> List[str]:
+    """
+        Hashes of the blocks asked for, in height order from from_height, or after the first hash of the
+        comma separated locator that is in the chain, up to count blocks.
+        Without either parameter, the last count blocks from the last block down, or the whole chain without count.
+    """
+    from_height = request.args.get('from_height', type=int)
+    locator = request.args.get('locator')
+    count = request.args.get('count', type=int)
+    # Resolved up front and under the chain lock, so a reorganization or a new block doesn't change the heights
+    # while they are read, and the response stays consistent while it streams
+    with blockchain.lock:
+        if from_height is None and locator is None:
+            lowest_height = 1 if count is None else blockchain.length - min(count, max_count) + 1
+            heights = range(blockchain.length, max(lowest_height, 1) - 1, -1)
+        else:
+            if locator is not None:
+                from_height = blockchain.get_locator_height(locator.split(",")) + 1
+            count = max_count if count is None else min(count, max_count)
+            heights = range(max(from_height, 1), min(from_height + count, blockchain.length + 1))
+        return [blockchain.block_hashes_by_height[height] for height in heights]
+
+
+def stream_json_list(block_hashes: List[str], to_json) -> Iterator[str]:
+    """
+        to_json gives the JSON of a block from its hash.
+    """
+    yield "["
+    for position, block_hash in enumerate(block_hashes):
+        yield ("," if position else "") + json.dumps(to_json(block_hash))
+    yield "]"
+
+
+def stream_encoded_chain(block_hashes: List[str]) -> Iterator[bytes]:
+    yield encode_chain_start(len(block_hashes))
+    for block_hash in block_hashes:
+        yield encode_chain_entry(blockchain.get_encoded_block(block_hash))
+
+
+def accepts_binary() -> bool:
+    return request.accept_mimetypes.best_match([JSON_CONTENT_TYPE, BINARY_CONTENT_TYPE]) == BINARY_CONTENT_TYPE
+
+
 @app.route("/", methods=['GET'])
 def index_route():
     return "Hello world", 200
@@ -46,63 +125,91 @@ def index_route():
 
 @app.route("/transaction", methods=['POST'])
 def create_transaction():
-    content = request.json
+    announced_hash = request.headers.get(TRANSACTION_HASH_HEADER)
+    if announced_hash and seen_transactions.seen(announced_hash):
+        return 'Message already processed', 200
     try:
-        if content.get('transaction'):
-            transaction = Transaction.from_json(content.get('transaction'))
+        transaction = read_request_object('transaction', Transaction.from_json, Transaction.from_bytes)
+        if transaction:
+            if seen_transactions.seen(transaction.hash):
+                return 'Message already processed', 200
             transaction.sign_inputs(owner=my_wallet)
             validate = TransactionValidation(
-                transaction=transaction, blockchain=blockchain)
+                transaction=transaction, blockchain=blockchain,
+                utxo_set=MempoolUTXOView(blockchain.utxo_set, blockchain.mempool))
             validate.validate()
-            store_transactions_in_memory([transaction.to_dict])
-    except TransactionValidationException as transaction_exception:
+            blockchain.mempool.add(transaction)
+            seen_transactions.add(transaction.hash)
+    except (TransactionValidationException, MempoolException, SerializationException) as transaction_exception:
         return f'{transaction_exception}', 400
     return "Transaction success", 200
 
 
 @app.route("/block", methods=['POST'])
 def receive_block():
-    content = request.json
-    message_id = generate_message_id(content)
-
-    if message_id in processed_messages:
-        print(f'Message already processed - {message_id}')
+    # Peers send the block hash along, so a block relayed by several of them is only read once
+    announced_hash = request.headers.get(BLOCK_HASH_HEADER)
+    if announced_hash and seen_blocks.seen(announced_hash):
+        print(f'Message already processed - {announced_hash}')
+        return 'Message already processed', 200
+    try:
+        new_block = read_request_object('block', Block.from_json, Block.from_bytes)
+    except SerializationException as e:
+        return f'{e}', 400
+    if not new_block:
+        return "No block in request", 400
+    block_hash = new_block.header.hash
+    if announced_hash and announced_hash != block_hash:
+        return f"{BLOCK_HASH_HEADER} doesn't match the block hash", 400
+
+    if not seen_blocks.add(block_hash):
+        print(f'Message already processed - {block_hash}')
         return 'Message already processed', 200
 
-    processed_messages.add(message_id)
-
-    print(f"Processing message: {message_id}")
+    print(f"Processing message: {block_hash}")
     try:
-        if content.get('block'):
-            new_block = Block.from_json(content.get('block'))
-            validate = BlockValidation(block=new_block, blockchain=blockchain)
-            validate.validate()
-            blockchain.add_new_block(new_block=new_block)
-            network.broadcast_block(new_block)
-    except BlockException as e:
+        blockchain.add_new_block(new_block=new_block)
+        network.broadcast_block(new_block)
+    except OrphanBlockException as e:
+        # The sender has the blocks this node is missing, an unknown sender leaves it to a chain sync
+        sender = network.peers.get(request.headers.get(NODE_HEADER))
+        if sender:
+            chain_sync.start_fetch_missing_parents(sender, block_hash)
+        else:
+            chain_sync.start_background_sync()
+        return f'{e}', 200
+    except BlockchainException as e:
+        # Forgotten, so a valid block with the same header isn't taken for this one
+        seen_blocks.discard(block_hash)
         return f'{e}', 400
     return "New block added", 200
 
 
 @app.route("/chain", methods=['GET'])
 def send_chain():
-    data = []
-    current_block = blockchain.last_block
-    while current_block:
-        data.append(current_block.to_dict)
-        current_block = current_block.previous_block
-    return jsonify(data)
+    block_hashes = get_requested_block_hashes(SYNC_BLOCKS_BATCH_SIZE)
+    if accepts_binary():
+        return Response(stream_encoded_chain(block_hashes), mimetype=BINARY_CONTENT_TYPE)
+    return Response(stream_json_list(block_hashes, lambda block_hash: blockchain.get_block_by_hash(block_hash).to_dict),
+                    mimetype=JSON_CONTENT_TYPE)
 
 
 @app.route("/chain/headers", methods=['GET'])
 def send_chain_headers_only():
-    data = []
-    current_block = blockchain.last_block
-    while current_block:
-        data.append({**current_block.header.to_dict,
-                    "hash": current_block.header.hash})
-        current_block = current_block.previous_block
-    return jsonify(data)
+    block_hashes = get_requested_block_hashes(SYNC_HEADERS_BATCH_SIZE)
+    # Served from the block index, the blocks aren't read from the block store
+    return Response(stream_json_list(block_hashes,
+                                     lambda block_hash: {**blockchain.get_header_by_hash(block_hash).to_dict,
+                                                         "hash": block_hash}),
+                    mimetype=JSON_CONTENT_TYPE)
+
+
+@app.route("/chain/tip", methods=['GET'])
+def send_chain_tip():
+    return jsonify({
+        "height": blockchain.length,
+        "hash": blockchain.last_block.header.hash if blockchain.last_block else None,
+    })
 
 
 @app.route("/block/<hash>", methods=['GET'])
@@ -110,9 +217,54 @@ def get_block_by_hash(hash: str):
     block = blockchain.get_block_by_hash(hash)
     if not block:
         return "Block not found", 404
+    if accepts_binary():
+        return Response(block.to_bytes, mimetype=BINARY_CONTENT_TYPE)
+    return jsonify(block.to_dict)
+
+
+@app.route("/block/height/<int:height>", methods=['GET'])
+def get_block_by_height(height: int):
+    block = blockchain.get_block_by_height(height)
+    if not block:
+        return "Block not found", 404
+    if accepts_binary():
+        return Response(block.to_bytes, mimetype=BINARY_CONTENT_TYPE)
     return jsonify(block.to_dict)
 
 
+@app.route("/tx/<hash>", methods=['GET'])
+def get_transaction_by_hash(hash: str):
+    location = blockchain.get_transaction_location(hash)
+    if not location:
+        return "Transaction not found", 404
+    block, position = location
+    transaction = block.transactions[position]
+    return jsonify({
+        **transaction.to_dict,
+        "hash": transaction.hash,
+        "block_hash": block.header.hash,
+        "block_height": blockchain.get_block_height(block.header.hash),
+        "position": position,
+    })
+
+
+@app.route("/tx/<hash>/proof", methods=['GET'])
+def get_transaction_proof(hash: str):
+    location = blockchain.get_transaction_location(hash)
+    if not location:
+        return "Transaction not found", 404
+    block, position = location
+    merkle_tree = MerkleTree([tx.merkle_leaf_bytes for tx in block.transactions])
+    return jsonify({
+        "transaction_hash": hash,
+        "header": {**block.header.to_dict, "hash": block.header.hash},
+        "block_height": blockchain.get_block_height(block.header.hash),
+        "position": position,
+        "leaf": calculate_sha256(block.transactions[position].merkle_leaf_bytes),
+        "proof": merkle_tree.get_proof(position),
+    })
+
+
 @app.route("/advertise", methods=['POST'])
 def advertise():
     content = request.json
@@ -128,13 +280,52 @@ def known_node():
     return jsonify(known_nodes_dict)
 
 
+@app.route("/network/peers", methods=['GET'])
+def peer_stats():
+    return jsonify(network.peers.to_dict)
+
+
+@app.route("/network/connections", methods=['GET'])
+def connection_stats():
+    return jsonify(network.connections.to_dict)
+
+
+@app.route("/signatures/cache", methods=['GET'])
+def public_key_cache_stats():
+    return jsonify(public_key_cache.to_dict)
+
+
 @app.route("/mine", methods=['POST'])
 def mine():
-    new_block = blockchain.create_new_block()
-    message_id = generate_message_id({"block": new_block.to_dict})
-    processed_messages.add(message_id)
-    network.broadcast_block(new_block)
-    return "Mined successfully", 200
+    """
+        Mines one more block in the background, the answer doesn't wait for it.
+    """
+    miner.start(blocks=1)
+    return jsonify(miner.to_dict), 202
+
+
+@app.route("/mine/start", methods=['POST'])
+def start_mining():
+    """
+        Mines until stopped, or the number of blocks in the body.
+    """
+    content = request.get_json(silent=True) or {}
+    blocks = content.get("blocks")
+    if blocks is not None and (type(blocks) is not int or blocks < 1):
+        return "Invalid number of blocks", 400
+    miner.start(blocks=blocks)
+    return jsonify(miner.to_dict), 202
+
+
+@app.route("/mine/stop", methods=['POST'])
+def stop_mining():
+    miner.stop()
+    return jsonify(miner.to_dict), 200
+
+
+@app.route("/mine/status", methods=['GET'])
+def mining_status():
+    return jsonify(miner.to_dict)
 
 
 if __name__ == '__main__':
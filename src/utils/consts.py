@@ -1,2 +1,55 @@
+import os
+
 NUMBER_OF_LEADING_ZEROS_IN_HASH = 4
-MINER_REWARD = 6.25
\ No newline at end of file
+MINER_REWARD = 6.25
+MINING_WORKERS = int(os.getenv('MINING_WORKERS', os.cpu_count() or 1))
+# Seconds between two checks of the chain tip and the mempool by the background miner,
+# and the age a block candidate reaches before a mempool change replaces it
+MINER_POLL_INTERVAL = 0.2
+MINER_TEMPLATE_REFRESH = 2.0
+# Blocks kept in memory when the chain is backed by a block store
+BLOCK_CACHE_SIZE = 100
+# Blocks at the end of the chain that keep the data to disconnect them, the deepest reorganization accepted
+MAX_REORG_DEPTH = 100
+# Blocks kept while their parent is missing, and parents asked for one by one before falling back to a chain sync
+ORPHAN_POOL_SIZE = 100
+ORPHAN_PARENT_REQUESTS = 10
+# Seconds between a mempool change and the snapshot written to disk
+MEMPOOL_SNAPSHOT_DELAY = 1.0
+# Limits on the mempool transactions picked for a new block
+MAX_BLOCK_SIZE = 1000000
+MAX_BLOCK_TRANSACTIONS = 2000
+# Entries kept for transactions and blocks that already passed validation
+VALIDATION_CACHE_SIZE = 100000
+# Threads verifying signatures, and signatures handed to a thread at once
+SIGNATURE_VERIFICATION_WORKERS = int(os.getenv('SIGNATURE_VERIFICATION_WORKERS', os.cpu_count() or 1))
+SIGNATURE_VERIFICATION_BATCH_SIZE = 16
+# Parsed public keys kept for signature checks
+PUBLIC_KEY_CACHE_SIZE = 1024
+# Compiled scripts and public key hashes kept by the script interpreter
+SCRIPT_CACHE_SIZE = 4096
+# Threads sending gossip, seconds to wait for a peer, and attempts per peer with a doubling delay between them
+GOSSIP_WORKERS = 8
+GOSSIP_TIMEOUT = 2.0
+GOSSIP_MAX_ATTEMPTS = 3
+GOSSIP_RETRY_DELAY = 0.5
+# Keep-alive connections kept per peer, and seconds to wait to connect to a peer and for its answer
+PEER_POOL_SIZE = int(os.getenv('PEER_POOL_SIZE', 4))
+PEER_CONNECT_TIMEOUT = float(os.getenv('PEER_CONNECT_TIMEOUT', 2.0))
+PEER_READ_TIMEOUT = float(os.getenv('PEER_READ_TIMEOUT', 5.0))
+# Headers and blocks requested from a peer at once when catching up with it
+SYNC_HEADERS_BATCH_SIZE = 2000
+SYNC_BLOCKS_BATCH_SIZE = 100
+# Seconds between a known nodes change and the write to disk, failed requests in a row before a peer is dropped,
+# and the weight of the last answer time in a peer average latency
+PEER_TABLE_SAVE_DELAY = 1.0
+PEER_MAX_FAILURES = 3
+PEER_LATENCY_SMOOTHING = 0.2
+# Hashes of processed gossip messages kept, and seconds before one is forgotten
+MESSAGE_CACHE_SIZE = 100000
+MESSAGE_CACHE_TTL = 600.0
+# Headers carrying the hash of a posted block or transaction, checked before the body is read
+BLOCK_HASH_HEADER = "X-Block-Hash"
+TRANSACTION_HASH_HEADER = "X-Transaction-Hash"
+# Header carrying the base url of the node that sent a gossip message
+NODE_HEADER = "X-Node"
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from Crypto.Hash import RIPEMD160, SHA256
 
 
@@ -13,3 +15,28 @@ def calculate_ripemd160(data: str | bytes) -> str:
         data = bytearray(data, "utf-8")
     hash_obj = RIPEMD160.new(data)
     return hash_obj.hexdigest()
+
+
+def hex_to_bytes(value: str) -> Optional[bytes]:
+    """
+        Raw bytes of a lowercase hex string, None when the string wouldn't come back identical from bytes.hex().
+    """
+    if not value:
+        return None
+    try:
+        raw = bytes.fromhex(value)
+    except ValueError:
+        return None
+    return raw if raw.hex() == value else None
+
+
+def compact_hex(value):
+    """
+        Hex strings are kept in memory as their raw bytes, half the size, any other value is kept as it is.
+    """
+    raw = hex_to_bytes(value) if type(value) is str else None
+    return value if raw is None else raw
+
+
+def expand_hex(value):
+    return value.hex() if type(value) is bytes else value
@@ -0,0 +1,166 @@
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+from src.core.blocks.block import Block
+
+block_stores_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../mem_pools/blocks'))
+
+# Every block record in the segment file is prefixed by its length
+RECORD_LENGTH = struct.Struct(">I")
+
+
+class BlockStoreException(Exception):
+    pass
+
+
+def get_block_store_path(hostname: str, port) -> str:
+    return os.path.join(block_stores_path, f"{hostname}_{port}")
+
+
+class BlockStore:
+    """
+        Append-only block storage.
+
+        Blocks are appended to a segment file (blocks.dat) as length-prefixed binary records, and every write adds
+        a "<hash> <height> <offset> <length>" line to an index file (blocks.idx).
+        Blocks of side branches are stored too, a block is always written after its parent.
+        Only the index is loaded in memory, blocks are read from the segment file when requested.
+    """
+    SEGMENT_FILE = "blocks.dat"
+    INDEX_FILE = "blocks.idx"
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.segment_path = os.path.join(path, self.SEGMENT_FILE)
+        self.index_path = os.path.join(path, self.INDEX_FILE)
+        # block hash -> (offset, length) of the record in the segment file
+        self.locations: Dict[str, Tuple[int, int]] = {}
+        # (block hash, height) in the order the blocks were written
+        self.entries: List[Tuple[str, int]] = []
+        self.load_index()
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self.locations
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.entries) == 0
+
+    @staticmethod
+    def encode_block(block: Block) -> bytes:
+        return block.to_bytes
+
+    @staticmethod
+    def decode_block(data: bytes) -> Block:
+        # Stores written before the binary format hold JSON records
+        if data[:1] == b"{":
+            return Block.from_json(json.loads(data))
+        return Block.from_bytes(data)
+
+    def load_index(self):
+        segment_size = os.path.getsize(self.segment_path) if os.path.exists(self.segment_path) else 0
+        valid_index_lines = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as file_obj:
+                for line in file_obj:
+                    parts = line.split()
+                    if len(parts) != 4:
+                        break
+                    block_hash, height, offset, length = parts[0], int(parts[1]), int(parts[2]), int(parts[3])
+                    if offset + RECORD_LENGTH.size + length > segment_size:
+                        break
+                    self.locations[block_hash] = (offset, length)
+                    self.entries.append((block_hash, height))
+                    valid_index_lines.append(line)
+        self.recover(segment_size, valid_index_lines)
+
+    def recover(self, segment_size: int, valid_index_lines: List[str]):
+        """
+            Brings the index and the segment file back in line after an interrupted write.
+
+            Complete records missing from the index are indexed again, a partially written record is truncated.
+        """
+        end_of_indexed_data = 0
+        if self.entries:
+            offset, length = self.locations[self.entries[-1][0]]
+            end_of_indexed_data = offset + RECORD_LENGTH.size + length
+        recovered_lines = []
+        heights = dict(self.entries)
+        with open(self.segment_path, "ab+") as segment:
+            segment.seek(end_of_indexed_data)
+            offset = end_of_indexed_data
+            while offset + RECORD_LENGTH.size <= segment_size:
+                (length,) = RECORD_LENGTH.unpack(segment.read(RECORD_LENGTH.size))
+                if offset + RECORD_LENGTH.size + length > segment_size:
+                    break
+                block = self.decode_block(segment.read(length))
+                height = heights.get(block.header.previous_hash, 0) + 1
+                block_hash = block.header.hash
+                heights[block_hash] = height
+                self.locations[block_hash] = (offset, length)
+                self.entries.append((block_hash, height))
+                recovered_lines.append(f"{block_hash} {height} {offset} {length}\n")
+                offset += RECORD_LENGTH.size + length
+            if offset < segment_size:
+                segment.truncate(offset)
+        if recovered_lines or len(valid_index_lines) != self.count_index_lines():
+            with open(self.index_path, "w") as file_obj:
+                file_obj.writelines(valid_index_lines + recovered_lines)
+
+    def count_index_lines(self) -> int:
+        if not os.path.exists(self.index_path):
+            return 0
+        with open(self.index_path, "r") as file_obj:
+            return sum(1 for _ in file_obj)
+
+    def append(self, block: Block, height: int):
+        block_hash = block.header.hash
+        if block_hash in self.locations:
+            return
+        data = self.encode_block(block)
+        with open(self.segment_path, "ab") as segment:
+            offset = segment.tell()
+            segment.write(RECORD_LENGTH.pack(len(data)) + data)
+            segment.flush()
+            os.fsync(segment.fileno())
+        with open(self.index_path, "a") as file_obj:
+            file_obj.write(f"{block_hash} {height} {offset} {len(data)}\n")
+        self.locations[block_hash] = (offset, len(data))
+        self.entries.append((block_hash, height))
+
+    def read_record(self, block_hash: str) -> bytes:
+        location = self.locations.get(block_hash)
+        if location is None:
+            raise BlockStoreException(f"Block {block_hash} is not in the block store")
+        offset, length = location
+        with open(self.segment_path, "rb") as segment:
+            segment.seek(offset + RECORD_LENGTH.size)
+            return segment.read(length)
+
+    def read_block(self, block_hash: str) -> Block:
+        return self.decode_block(self.read_record(block_hash))
+
+    def read_encoded_block(self, block_hash: str) -> bytes:
+        """
+            The block in the binary format, straight from the segment file unless it was stored as JSON.
+        """
+        record = self.read_record(block_hash)
+        if record[:1] == b"{":
+            return self.decode_block(record).to_bytes
+        return record
+
+    def iter_blocks(self) -> Iterator[Tuple[Block, int]]:
+        """
+            Reads the stored blocks sequentially, in the order they were written, with their heights.
+        """
+        with open(self.segment_path, "rb") as segment:
+            for block_hash, height in self.entries:
+                offset, length = self.locations[block_hash]
+                segment.seek(offset + RECORD_LENGTH.size)
+                yield self.decode_block(segment.read(length)), height
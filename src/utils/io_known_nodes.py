@@ -1,28 +1,40 @@
 import json
 import os
+import tempfile
 from typing import List
 
 known_nodes = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../mem_pools/network_nodes.json'))
 
-def get_known_nodes() -> List[dict]:
-    with open(known_nodes, "r") as file_obj:
+def get_known_nodes(path: str = known_nodes) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file_obj:
         known_nodes_str = file_obj.read()
         known_nodes_dict = json.loads(known_nodes_str)
     return known_nodes_dict
 
-def add_known_nodes(nodes: List[dict]):
-    current_known_nodes = get_known_nodes()
+def save_known_nodes(nodes: List[dict], path: str = known_nodes):
+    text = json.dumps(nodes, indent=4)
+    # Written to a unique file next to it and renamed, so another node reading it never sees a partial list.
+    # Nodes in containers sharing the directory can have the same pid, the name can't depend on it
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as file_obj:
+            file_obj.write(text)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+def add_known_nodes(nodes: List[dict], path: str = known_nodes):
+    current_known_nodes = get_known_nodes(path)
     for node in nodes:
         if node not in current_known_nodes:
             current_known_nodes.append(node)
-    text = json.dumps(current_known_nodes, indent=4)
-    with open(known_nodes, "w") as file_obj:
-        file_obj.write(text)
+    save_known_nodes(current_known_nodes, path)
 
-def remove_known_node(node: dict):
-    current_known_nodes = get_known_nodes()
+def remove_known_node(node: dict, path: str = known_nodes):
+    current_known_nodes = get_known_nodes(path)
     if node in current_known_nodes:
         current_known_nodes.remove(node)
-        text = json.dumps(current_known_nodes, indent=4)
-        with open(known_nodes, "w") as file_obj:
-            file_obj.write(text)
\ No newline at end of file
+        save_known_nodes(current_known_nodes, path)
@@ -1,26 +1,33 @@
 import json
 import os
+import tempfile
 from typing import List
 
-mem_pool_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../mem_pools/transactions.json'))
+mem_pools_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../mem_pools'))
+mem_pool_path = os.path.join(mem_pools_path, 'transactions.json')
 
-def get_transactions_from_memory() -> List[dict]:
-    with open(mem_pool_path, "r") as file_obj:
-        current_mem_pool_str = file_obj.read()
-        current_mem_pool_list = json.loads(current_mem_pool_str)
-    return current_mem_pool_list
 
-def store_transactions_in_memory(transactions: List[dict]):
-    current_transactions = get_transactions_from_memory()
-    for transaction in transactions:
-        current_transactions.append(transaction)
-    text = json.dumps(current_transactions, indent=4)
-    with open(mem_pool_path, "w") as file_obj:
-        file_obj.write(text)
+def get_mem_pool_path(hostname: str, port) -> str:
+    # Nodes share the mem_pools directory, each keeps its own snapshot
+    return os.path.join(mem_pools_path, f"transactions_{hostname}_{port}.json")
 
-def reset_transaction_memory():
-    text = json.dumps([], indent=4)
-    with open(mem_pool_path, "w") as file_obj:
-        file_obj.write(text)
 
+def get_transactions_from_memory(path: str = mem_pool_path) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file_obj:
+        current_mem_pool_str = file_obj.read()
+        current_mem_pool_list = json.loads(current_mem_pool_str)
+    return current_mem_pool_list
 
+def save_transactions_in_memory(transactions: List[dict], path: str = mem_pool_path):
+    text = json.dumps(transactions, indent=4)
+    # Written to a unique file next to it and renamed, so readers never see a partial snapshot
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as file_obj:
+            file_obj.write(text)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
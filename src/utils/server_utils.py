@@ -1,9 +1,7 @@
-import json
 import os
 import socket
 import argparse
 
-from src.utils.crypto_utils import calculate_sha256
 from src.utils.io_known_nodes import remove_known_node
 from src.network.node import Node
 
@@ -20,6 +18,3 @@ def get_host_port():
 def cleanup(my_node: Node):
     remove_known_node(my_node.to_dict)
     print("Closing server, removing self from known_nodes")
-
-def generate_message_id(message):
-    return calculate_sha256(json.dumps(message, sort_keys=True).encode())
\ No newline at end of file
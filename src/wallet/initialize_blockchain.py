@@ -1,7 +1,10 @@
 from src.core.blockchain import Blockchain
+from src.core.mempool import Mempool
 from src.core.transactions.transaction import TransactionInput, TransactionOutput, Transaction
+from src.network.chain_sync import ChainSync
 from src.network.network import Network
-from src.utils.io_mem_pool import store_transactions_in_memory
+from src.utils.io_block_store import BlockStore, get_block_store_path
+from src.utils.io_mem_pool import get_mem_pool_path
 from src.wallet.wallet import Wallet
 from src.users.albert import private_key as albert_private_key
 from src.users.bertrand import private_key as bertrand_private_key
@@ -15,13 +18,23 @@ camille_wallet = Wallet(private_key=camille_private_key)
 
 def initialize_blockchain(my_wallet: Wallet, network: Network) -> Blockchain:
     network.join_network()
-    blockchain_dict = network.get_longest_blockchain()
-    blockchain = None
+    mempool = Mempool(snapshot_path=get_mem_pool_path(network.node.ip, network.node.port))
+    mempool.load_snapshot()
+    block_store = BlockStore(get_block_store_path(network.node.ip, network.node.port))
+    if not block_store.is_empty:
+        print(f"Loading {len(block_store)} blocks from {block_store.path}")
+        # The replay drops the snapshot transactions that were mined meanwhile
+        blockchain = Blockchain.from_block_store(block_store, wallet=my_wallet, mempool=mempool)
+        ChainSync(blockchain, network).sync()
+        return blockchain
 
-    if blockchain_dict:
-        blockchain = Blockchain.from_json_list(blockchain_dict, wallet=my_wallet)
-    if not blockchain:
-        blockchain = Blockchain(wallet=my_wallet)
+    # Start from an empty chain and download it from the peers
+    blockchain = Blockchain(my_wallet, None, 0, mempool=mempool)
+    if ChainSync(blockchain, network).sync():
+        blockchain.attach_block_store(block_store)
+    else:
+        blockchain = Blockchain(wallet=my_wallet, mempool=mempool)
+        blockchain.attach_block_store(block_store)
 
         blockchain.create_new_block(transactions=[])
 
@@ -40,7 +53,7 @@ def initialize_blockchain(my_wallet: Wallet, network: Network) -> Blockchain:
                                      amount=3)
         transaction = Transaction(outputs=[output_0, output_1], inputs=[input_0])
 
-        store_transactions_in_memory([transaction.to_dict])
+        mempool.add(transaction)
         blockchain.create_new_block()
 
         # Uncomment to test transactions from mempool
@@ -52,6 +65,6 @@ def initialize_blockchain(my_wallet: Wallet, network: Network) -> Blockchain:
         #                              amount=1.5)
         # transaction = Transaction(outputs=[output_0, output_1], inputs=[input_0])
         # transaction.sign_inputs(my_wallet)
-        # store_transactions_in_memory([transaction.to_dict])
+        # mempool.add(transaction)
 
     return blockchain
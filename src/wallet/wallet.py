@@ -1,13 +1,63 @@
 import binascii
+import threading
+from collections import OrderedDict
 
 import base58
 from Crypto.Hash import SHA256
 from Crypto.PublicKey import RSA
 from Crypto.Signature import pkcs1_15
 
+from src.utils.consts import PUBLIC_KEY_CACHE_SIZE
 from src.utils.crypto_utils import calculate_sha256, calculate_ripemd160
 
 
+class PublicKeyCache:
+    """
+        Bounded LRU of signature verifiers keyed by hex public key.
+
+        Parsing a DER encoded 2048-bit key is the expensive part of a signature check,
+        and a handful of keys sign most transactions.
+    """
+    def __init__(self, max_size: int = PUBLIC_KEY_CACHE_SIZE):
+        self.max_size = max_size
+        self.verifiers = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_verifier(self, public_key: bytes | str):
+        """
+            Returns the pkcs1_15 verifier of the hex public key, raises ValueError for a key that can't be parsed.
+        """
+        key = public_key.decode("utf-8") if isinstance(public_key, bytes) else public_key
+        with self.lock:
+            verifier = self.verifiers.get(key)
+            if verifier is not None:
+                self.verifiers.move_to_end(key)
+                self.hits += 1
+                return verifier
+            self.misses += 1
+        verifier = pkcs1_15.new(RSA.import_key(binascii.unhexlify(key)))
+        with self.lock:
+            self.verifiers[key] = verifier
+            while len(self.verifiers) > self.max_size:
+                self.verifiers.popitem(last=False)
+        return verifier
+
+    @property
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "size": len(self.verifiers),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+public_key_cache = PublicKeyCache()
+
+
 class Wallet:
     def __init__(self, private_key: str = None):
         if private_key:
@@ -54,9 +104,8 @@ class Wallet:
         hash_obj = SHA256.new(message)
 
         try:
-            imported_key = RSA.import_key(binascii.unhexlify(public_key))
-            # Verify the signature
-            pkcs1_15.new(imported_key).verify(hash_obj, signature)
+            # Verify the signature with the parsed key shared by every check
+            public_key_cache.get_verifier(public_key).verify(hash_obj, signature)
             return True
         except (ValueError, TypeError):
             return False
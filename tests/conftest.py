@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Modules import each other as src.*, the legacy network module imports its siblings from src
+REPOSITORY_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [REPOSITORY_ROOT, os.path.join(REPOSITORY_ROOT, 'src')]
+# Read when the constants are imported, a single worker keeps mining in process
+os.environ.setdefault('MINING_WORKERS', '1')
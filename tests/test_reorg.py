@@ -0,0 +1,173 @@
+from typing import List
+
+import pytest
+
+from src.core.blockchain import Blockchain, BlockchainException
+from src.core.blocks.block import Block, BlockHeader
+from src.core.blocks.block_validation import ProofOfWork
+from src.core.merkle_tree import MerkleTree
+from src.core.transactions.transaction import Transaction, TransactionInput, TransactionOutput
+from src.utils.io_block_store import BlockStore
+from src.wallet.wallet import Wallet
+
+
+def clone(block: Block) -> Block:
+    # Chains never share block objects, as with blocks received from a peer
+    return Block.from_bytes(block.to_bytes)
+
+
+def copy_chain(blockchain: Blockchain, height: int, wallet: Wallet) -> Blockchain:
+    blocks = [clone(blockchain.get_block_by_height(h)) for h in range(height, 0, -1)]
+    return Blockchain.from_block_list(blocks, wallet)
+
+
+def utxo_state(blockchain: Blockchain) -> dict:
+    return {outpoint: (tx_output.amount, tx_output.public_key_hash)
+            for outpoint, tx_output in blockchain.utxo_set.outputs.items()}
+
+
+def assert_height_index(blockchain: Blockchain):
+    assert len(blockchain.block_heights) == len(blockchain.block_hashes_by_height) == blockchain.length
+    for height in range(1, blockchain.length + 1):
+        block_hash = blockchain.block_hashes_by_height[height]
+        assert blockchain.block_heights[block_hash] == height
+        assert blockchain.block_index[block_hash].height == height
+    assert blockchain.block_hashes_by_height[blockchain.length] == blockchain.last_block.header.hash
+
+
+def assert_same_chain(blockchain: Blockchain, expected: Blockchain):
+    assert blockchain.length == expected.length
+    assert blockchain.last_block.header.hash == expected.last_block.header.hash
+    assert utxo_state(blockchain) == utxo_state(expected)
+    assert_height_index(blockchain)
+
+
+def pay_from_coinbase(blockchain: Blockchain, recipient: Wallet) -> Transaction:
+    coin_base = blockchain.last_block.transactions[-1]
+    transaction = Transaction([TransactionInput(coin_base.hash, 0)], [TransactionOutput(recipient.public_key_hash, 1)])
+    transaction.sign_inputs(blockchain.wallet)
+    return transaction
+
+
+def mine_block(previous: Block, transactions: List[Transaction], wallet: Wallet) -> Block:
+    """
+        Block built outside of any chain, so it can hold transactions a chain would refuse.
+    """
+    transactions = transactions + [ProofOfWork.get_coin_base_transaction(0, wallet)]
+    header = BlockHeader(index=previous.header.index + 1, previous_hash=previous.header.hash,
+                         merkle_root=MerkleTree.compute_root([tx.merkle_leaf_bytes for tx in transactions]))
+    header.nonce = ProofOfWork.find_nonce(header)
+    return Block(header, transactions)
+
+
+@pytest.fixture
+def wallet() -> Wallet:
+    return Wallet()
+
+
+@pytest.fixture
+def main_chain(wallet) -> Blockchain:
+    blockchain = Blockchain(wallet)
+    for _ in range(2):
+        blockchain.create_new_block(transactions=[])
+    return blockchain
+
+
+def test_disconnect_last_block_restores_the_utxo_set(main_chain):
+    utxo_before = utxo_state(main_chain)
+    tip_before = main_chain.last_block.header.hash
+    transaction = pay_from_coinbase(main_chain, Wallet())
+    block = main_chain.create_new_block(transactions=[transaction])
+    assert utxo_state(main_chain) != utxo_before
+
+    assert main_chain.disconnect_last_block() is block
+
+    assert main_chain.last_block.header.hash == tip_before
+    assert utxo_state(main_chain) == utxo_before
+    assert transaction.hash not in main_chain.transaction_locations
+    assert block.header.hash not in main_chain.block_undos
+    # Off the chain but still in the block tree
+    assert block.header.hash in main_chain.block_index
+    assert_height_index(main_chain)
+
+
+def test_side_branch_with_more_work_takes_over(main_chain):
+    fork = copy_chain(main_chain, main_chain.length, Wallet())
+    transaction = pay_from_coinbase(main_chain, Wallet())
+    main_chain.mempool.add(transaction)
+    main_chain.create_new_block()
+    assert transaction.hash in main_chain.transaction_locations
+    for _ in range(3):
+        fork.create_new_block(transactions=[])
+
+    for height in range(4, fork.length + 1):
+        main_chain.add_new_block(clone(fork.get_block_by_height(height)))
+
+    assert_same_chain(main_chain, fork)
+    # The transaction of the block that left the chain waits to be mined again
+    assert transaction.hash not in main_chain.transaction_locations
+    assert transaction.hash in main_chain.mempool
+
+
+def test_side_branch_with_less_work_is_kept_aside(main_chain):
+    fork = copy_chain(main_chain, main_chain.length - 1, Wallet())
+    fork.create_new_block(transactions=[])
+    tip_before = main_chain.last_block.header.hash
+    utxo_before = utxo_state(main_chain)
+
+    side_block = clone(fork.last_block)
+    main_chain.add_new_block(side_block)
+
+    assert main_chain.last_block.header.hash == tip_before
+    assert utxo_state(main_chain) == utxo_before
+    assert side_block.header.hash in main_chain.block_index
+    assert side_block.header.hash not in main_chain.block_heights
+
+
+def test_invalid_branch_rolls_back_to_the_previous_chain(main_chain, wallet):
+    tip_before = main_chain.last_block.header.hash
+    utxo_before = utxo_state(main_chain)
+    fork_point = main_chain.get_block_by_height(main_chain.length - 1)
+    unknown_output = Transaction([TransactionInput("ab" * 32, 0)], [TransactionOutput(wallet.public_key_hash, 1)])
+    unknown_output.sign_inputs(wallet)
+    first = mine_block(fork_point, [], wallet)
+    invalid = mine_block(first, [unknown_output], wallet)
+    last = mine_block(invalid, [], wallet)
+
+    main_chain.add_new_block(clone(first))
+    with pytest.raises(BlockchainException):
+        main_chain.add_new_block(clone(invalid))
+    with pytest.raises(BlockchainException):
+        main_chain.add_new_block(clone(last))
+
+    assert main_chain.last_block.header.hash == tip_before
+    assert utxo_state(main_chain) == utxo_before
+    assert main_chain.block_index[invalid.header.hash].invalid
+    assert_height_index(main_chain)
+    # Blocks built on the invalid one are refused as soon as they arrive
+    with pytest.raises(BlockchainException):
+        main_chain.add_new_block(clone(mine_block(last, [], wallet)))
+
+
+def test_reload_from_block_store_after_reorganizations(main_chain, tmp_path):
+    main_chain.attach_block_store(BlockStore(str(tmp_path)))
+    fork = copy_chain(main_chain, main_chain.length - 1, Wallet())
+    for _ in range(2):
+        fork.create_new_block(transactions=[])
+    for height in range(main_chain.length, fork.length + 1):
+        main_chain.add_new_block(clone(fork.get_block_by_height(height)))
+    assert_same_chain(main_chain, fork)
+
+    reloaded = Blockchain.from_block_store(BlockStore(str(tmp_path)), main_chain.wallet)
+    assert_same_chain(reloaded, main_chain)
+    assert set(reloaded.block_index) == set(main_chain.block_index)
+
+    # A second reorganization on the reloaded chain is replayed the same way
+    second_fork = copy_chain(reloaded, reloaded.length - 1, Wallet())
+    for _ in range(2):
+        second_fork.create_new_block(transactions=[])
+    for height in range(reloaded.length, second_fork.length + 1):
+        reloaded.add_new_block(clone(second_fork.get_block_by_height(height)))
+    assert_same_chain(reloaded, second_fork)
+
+    assert_same_chain(Blockchain.from_block_store(BlockStore(str(tmp_path)), main_chain.wallet), second_fork)
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from src.core.blockchain import Blockchain
+from src.core.blocks.block import Block
+from src.core.merkle_tree import MerkleTree
+from src.core.serialization import ChainDecoder, SerializationException, encode_chain_entry, encode_chain_start
+from src.core.transactions.transaction import Transaction, TransactionInput, TransactionOutput
+from src.wallet.wallet import Wallet
+
+
+@pytest.fixture(scope="module")
+def blockchain() -> Blockchain:
+    wallet = Wallet()
+    blockchain = Blockchain(wallet)
+    blockchain.create_new_block(transactions=[])
+    transaction = Transaction(
+        inputs=[TransactionInput(blockchain.last_block.transactions[0].hash, 0)],
+        outputs=[TransactionOutput(Wallet().public_key_hash, 3), TransactionOutput(wallet.public_key_hash, 2.5)])
+    transaction.sign_inputs(wallet)
+    blockchain.create_new_block(transactions=[transaction])
+    return blockchain
+
+
+def from_json(block: Block) -> Block:
+    return Block.from_json(json.loads(json.dumps(block.to_dict)))
+
+
+def merkle_root(block: Block) -> str:
+    return MerkleTree.compute_root([transaction.merkle_leaf_bytes for transaction in block.transactions])
+
+
+def assert_same_block(decoded: Block, block: Block):
+    assert decoded.header.hash == block.header.hash
+    assert decoded.header.merkle_root == block.header.merkle_root
+    assert merkle_root(decoded) == block.header.merkle_root
+    assert [transaction.hash for transaction in decoded.transactions] == \
+        [transaction.hash for transaction in block.transactions]
+    assert decoded.to_dict == block.to_dict
+
+
+def test_mined_block_round_trips_through_binary_and_json(blockchain):
+    block = blockchain.last_block
+    assert len(block.transactions) == 2
+
+    assert_same_block(Block.from_bytes(block.to_bytes), block)
+    assert_same_block(from_json(block), block)
+    # Either way first, the other encoding gives back the same block
+    assert_same_block(from_json(Block.from_bytes(block.to_bytes)), block)
+    assert from_json(block).to_bytes == block.to_bytes
+
+
+def test_strings_keep_their_hex_or_text_form():
+    # Upper case and odd length hex, opcodes, empty and missing values must come back as they were sent,
+    # any change would change the transaction hash and the merkle root
+    transaction = Transaction(
+        inputs=[TransactionInput("ABcd", -3, "x  OP_DUP 00ff"), TransactionInput("abc", 0, "")],
+        outputs=[TransactionOutput("zz", 10), TransactionOutput(None, -1.5), TransactionOutput("00", 10.0)])
+    decoded = Transaction.from_bytes(transaction.to_bytes)
+
+    assert decoded.to_dict == transaction.to_dict
+    assert decoded.hash == transaction.hash
+    assert decoded.merkle_leaf_bytes == transaction.merkle_leaf_bytes
+    assert [type(tx_output.amount) for tx_output in decoded.outputs] == [int, float, float]
+
+
+def test_streamed_chain_decodes_in_any_pieces(blockchain):
+    blocks = [blockchain.get_block_by_height(height) for height in range(blockchain.length, 0, -1)]
+    data = encode_chain_start(len(blocks)) + b"".join(encode_chain_entry(block.to_bytes) for block in blocks)
+
+    decoder = ChainDecoder()
+    decoded = [block for position in range(len(data)) for block in decoder.feed(data[position:position + 1])]
+    decoder.finish()
+
+    assert len(decoded) == len(blocks)
+    for decoded_block, block in zip(decoded, blocks):
+        assert_same_block(decoded_block, block)
+
+
+def test_truncated_chain_is_incomplete(blockchain):
+    data = encode_chain_start(1) + encode_chain_entry(blockchain.last_block.to_bytes)
+    decoder = ChainDecoder()
+    assert decoder.feed(data[:-1]) == []
+    with pytest.raises(SerializationException):
+        decoder.finish()